@@ -17,11 +17,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'education.middleware.MetricsMiddleware',
+    'education.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'education.middleware.AccessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
 ]
 
@@ -57,7 +60,56 @@ DATABASES = {
     }
 }
 
+# Read replicas of the transaction DB: TXN_REPLICA_1_HOST/NAME, TXN_REPLICA_2_..., other fields default to TXN_DB_*.
+REPLICA_DATABASES = []
+for index in range(1, 10):
+    prefix = f'TXN_REPLICA_{index}_'
+    if not (os.getenv(prefix + 'HOST') or os.getenv(prefix + 'NAME')):
+        break
+    DATABASES[f'replica_{index}'] = {
+        **{field: os.getenv(prefix + field, DATABASES['default'][field]) for field in ('ENGINE', 'NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')},
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(f'replica_{index}')
+REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 5.0))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('REPLICA_LAG_CHECK_INTERVAL', 2.0))
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 15))
+
 DATABASE_ROUTERS = ['education.db_router.EducationRouter']
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+REPORT_CACHE_ALIAS = os.getenv('REPORT_CACHE_ALIAS', 'default')
+REPORT_CACHE_TIMEOUT = int(os.getenv('REPORT_CACHE_TIMEOUT', 3 * 60 * 60))
+ACCESS_CACHE_ALIAS = os.getenv('ACCESS_CACHE_ALIAS', 'default')
+ACCESS_CACHE_TIMEOUT = int(os.getenv('ACCESS_CACHE_TIMEOUT', 300))
+DASHBOARD_CACHE_ALIAS = os.getenv('DASHBOARD_CACHE_ALIAS', 'default')
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', 30))
+FRAGMENT_CACHE_ALIAS = os.getenv('FRAGMENT_CACHE_ALIAS', 'default')
+FRAGMENT_CACHE_TIMEOUT = int(os.getenv('FRAGMENT_CACHE_TIMEOUT', 24 * 60 * 60))
+SHARE_CACHE_ALIAS = os.getenv('SHARE_CACHE_ALIAS', 'default')
+SHARE_CACHE_SIZE = int(os.getenv('SHARE_CACHE_SIZE', 2048))
+SHARE_CACHE_TIMEOUT = int(os.getenv('SHARE_CACHE_TIMEOUT', 600))
+SHARE_CACHE_LOCAL_TTL = float(os.getenv('SHARE_CACHE_LOCAL_TTL', 5.0))
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+EVENT_INGEST_MODE = os.getenv('EVENT_INGEST_MODE', 'direct')
+EVENT_SPOOL_DIR = os.getenv('EVENT_SPOOL_DIR', BASE_DIR / 'spool')
+EVENT_BUFFER_MAX_SIZE = int(os.getenv('EVENT_BUFFER_MAX_SIZE', 200))
+EVENT_BUFFER_MAX_AGE = float(os.getenv('EVENT_BUFFER_MAX_AGE', 2.0))
+
+SYNC_JOB_EXECUTOR = os.getenv('SYNC_JOB_EXECUTOR', 'thread')
+SYNC_LOCK_TTL = int(os.getenv('SYNC_LOCK_TTL', 300))
+ASSET_JOB_WORKERS = int(os.getenv('ASSET_JOB_WORKERS', 2))
+
+ASYNC_DOCTOR_VIEWS = os.getenv('ASYNC_DOCTOR_VIEWS', 'false').lower() == 'true'
+
+REPORTING_ARCHIVE_DIR = os.getenv('REPORTING_ARCHIVE_DIR', BASE_DIR / 'archive')
 AUTH_PASSWORD_VALIDATORS = []
 LANGUAGE_CODE = 'en-us'
 TIME_ZONE = 'UTC'
@@ -67,6 +119,8 @@ STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR
+MEDIA_ACCEL_REDIRECT = os.getenv('MEDIA_ACCEL_REDIRECT', '')
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', 365 * 24 * 60 * 60))
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
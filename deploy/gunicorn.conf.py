@@ -0,0 +1,16 @@
+import multiprocessing
+import os
+
+# Threaded WSGI workers by default. GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker switches to the ASGI app;
+# pair it with ASYNC_DOCTOR_VIEWS=true once loadtest shows a win against the production database.
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+wsgi_app = 'config.asgi:application' if worker_class.startswith('uvicorn') else 'config.wsgi:application'
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = 1000
+accesslog = '-'
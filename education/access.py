@@ -0,0 +1,67 @@
+import uuid
+from dataclasses import dataclass
+from django.conf import settings
+from django.core.cache import caches
+from .models import Campaign, UserProfile
+from .sharedcache import is_shared
+
+
+@dataclass(frozen=True)
+class Access:
+    role: str = None
+    campaign_ids: frozenset = frozenset()
+    unrestricted: bool = False
+
+    def can_access(self, campaign_id):
+        if self.unrestricted:
+            return True
+        try:
+            return uuid.UUID(str(campaign_id)) in self.campaign_ids
+        except ValueError:
+            return False
+
+    def campaigns(self):
+        return Campaign.objects.all() if self.unrestricted else Campaign.objects.filter(id__in=self.campaign_ids)
+
+
+ANONYMOUS = Access()
+
+
+def _cache():
+    return caches[settings.ACCESS_CACHE_ALIAS]
+
+
+def _key(user_id):
+    return f'access:{user_id}'
+
+
+def load_access(user):
+    if user.is_superuser or user.is_staff:
+        return Access('admin', unrestricted=True)
+    profile = UserProfile.objects.filter(user_id=user.id).only('role').first()
+    if profile is None:
+        return ANONYMOUS
+    if profile.role == 'publisher':
+        ids = Campaign.objects.filter(created_by_id=user.id).values_list('id', flat=True)
+    else:
+        ids = profile.campaigns.values_list('id', flat=True)
+    return Access(profile.role, frozenset(ids))
+
+
+def access_for(user):
+    if not user.is_authenticated:
+        return ANONYMOUS
+    if not is_shared(settings.ACCESS_CACHE_ALIAS):
+        # Other workers could not see invalidate_access(), so revoked scope must not outlive the request.
+        return load_access(user)
+    cached = _cache().get(_key(user.id))
+    if cached is None:
+        access = load_access(user)
+        _cache().set(_key(user.id), (access.role, [str(pk) for pk in access.campaign_ids], access.unrestricted), settings.ACCESS_CACHE_TIMEOUT)
+        return access
+    role, ids, unrestricted = cached
+    return Access(role, frozenset(uuid.UUID(pk) for pk in ids), unrestricted)
+
+
+def invalidate_access(*user_ids):
+    _cache().delete_many([_key(user_id) for user_id in user_ids])
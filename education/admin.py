@@ -0,0 +1,10 @@
+from django.contrib import admin
+from .models import UserProfile
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(admin.ModelAdmin):
+    list_display = ('user', 'role')
+    list_filter = ('role',)
+    search_fields = ('user__username', 'user__email')
+    filter_horizontal = ('campaigns',)
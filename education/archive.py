@@ -0,0 +1,276 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import uuid
+import zlib
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from .models import ReportingEvent
+from .rollups import METRIC_FILTERS, SUMMARY_KEYS, cached_report, event_metrics, summarize_events, summary_key
+from .sync import iter_event_chunks
+
+MAGIC = b'INCSEG1\n'
+TRAILER = struct.Struct('<Q8s')
+TRAILER_MAGIC = b'INCSEGF\n'
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+DELETE_BATCH = 500
+INT_COLUMNS = ('collateral_id', 'field_rep_id', 'doctor_id', 'share_instance_id')
+METRICS = ('any',) + tuple(key for key in SUMMARY_KEYS if key != 'any')
+
+
+def archive_dir():
+    return Path(settings.REPORTING_ARCHIVE_DIR)
+
+
+def _micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(value):
+    return EPOCH + timedelta(microseconds=value)
+
+
+def _pack(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(typecode, raw):
+    values = array(typecode)
+    values.frombytes(raw)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def _row_metrics(event_type, video_percentage):
+    return ['any'] + event_metrics(event_type, video_percentage)
+
+
+def write_segment(campaign_id, month, rows, root=None):
+    # Written as `.pending`; only promoted once the source rows are deleted from the reporting DB.
+    event_types = sorted({row['event_type'] for row in rows})
+    codes = {kind: code for code, kind in enumerate(event_types)}
+    created = array('q', (_micros(row['created_at']) for row in rows))
+    percentages = array('h', (-1 if row['video_percentage'] is None else row['video_percentage'] for row in rows))
+    doctors = defaultdict(set)
+    for row in rows:
+        for metric in _row_metrics(row['event_type'], row['video_percentage']):
+            doctors[metric].add(row['doctor_id'])
+    columns = {
+        'id': ('uuid', b''.join(row['id'].bytes for row in rows)),
+        'event_type': ('B', _pack(array('B', (codes[row['event_type']] for row in rows)))),
+        'video_percentage': ('h', _pack(percentages)),
+        'created_at': ('q', _pack(created)),
+    }
+    for name in INT_COLUMNS:
+        columns[name] = ('q', _pack(array('q', (row[name] for row in rows))))
+    for metric in METRICS:
+        columns[f'doctors:{metric}'] = ('q', _pack(array('q', sorted(doctors[metric]))))
+
+    directory = (root or archive_dir()) / str(campaign_id) / month
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{min(created)}-{uuid.uuid4().hex[:8]}.seg.pending'
+    layout = {}
+    with open(path, 'wb') as output:
+        output.write(MAGIC)
+        for name, (typecode, raw) in columns.items():
+            blob = zlib.compress(raw, 6)
+            layout[name] = {'type': typecode, 'offset': output.tell(), 'length': len(blob)}
+            output.write(blob)
+        footer = json.dumps({
+            'campaign_id': str(campaign_id),
+            'rows': len(rows),
+            'event_types': event_types,
+            'columns': layout,
+            'stats': {
+                'created_at': [min(created), max(created)],
+                'doctor_id': [min(row['doctor_id'] for row in rows), max(row['doctor_id'] for row in rows)],
+                'video_percentage': [min(percentages), max(percentages)],
+            },
+        }).encode()
+        output.write(footer)
+        output.write(TRAILER.pack(len(footer), TRAILER_MAGIC))
+        output.flush()
+        os.fsync(output.fileno())
+    return path
+
+
+def promote(path):
+    final = path.with_suffix('')
+    os.replace(path, final)
+    return final
+
+
+class Segment:
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as source:
+            self._map = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        end = len(self._map) - TRAILER.size
+        footer_length, magic = TRAILER.unpack_from(self._map, end)
+        if magic != TRAILER_MAGIC or self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError(f'{self.path} is not an archive segment')
+        self.footer = json.loads(self._map[end - footer_length:end])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._map.close()
+
+    @property
+    def rows(self):
+        return self.footer['rows']
+
+    def bounds(self):
+        low, high = self.footer['stats']['created_at']
+        return _from_micros(low), _from_micros(high)
+
+    def column(self, name):
+        spec = self.footer['columns'][name]
+        raw = zlib.decompress(self._map[spec['offset']:spec['offset'] + spec['length']])
+        if spec['type'] == 'uuid':
+            return [uuid.UUID(bytes=raw[i:i + 16]) for i in range(0, len(raw), 16)]
+        values = _unpack(spec['type'], raw)
+        if name == 'event_type':
+            return [self.footer['event_types'][code] for code in values]
+        if name == 'created_at':
+            return [_from_micros(value) for value in values]
+        if name == 'video_percentage':
+            return [None if value < 0 else value for value in values]
+        return values
+
+    def rows_as_dicts(self):
+        names = ('id', 'event_type', 'video_percentage', 'created_at') + INT_COLUMNS
+        columns = [self.column(name) for name in names]
+        campaign_id = uuid.UUID(self.footer['campaign_id'])
+        return [dict(zip(names, values), campaign_id=campaign_id) for values in zip(*columns)]
+
+
+def _month(value):
+    return value.strftime('%Y-%m')
+
+
+def segment_paths(campaign_id=None, start=None, end=None, root=None, pending=False):
+    root = root or archive_dir()
+    campaigns = [root / str(campaign_id)] if campaign_id else sorted(path for path in root.glob('*') if path.is_dir())
+    suffix = '*.seg.pending' if pending else '*.seg'
+    for campaign_path in campaigns:
+        for month_path in sorted(campaign_path.glob('*')):
+            if (start and month_path.name < _month(start)) or (end and month_path.name > _month(end)):
+                continue
+            yield from sorted(month_path.glob(suffix))
+
+
+def segments(campaign_id=None, start=None, end=None, root=None):
+    for path in segment_paths(campaign_id, start, end, root):
+        segment = Segment(path)
+        low, high = segment.bounds()
+        if (start and high < start) or (end and low >= end):
+            segment.__exit__()
+            continue
+        yield segment
+
+
+def iter_segment_rows(campaign_id=None, start=None, end=None, root=None):
+    for segment in segments(campaign_id, start, end, root):
+        with segment:
+            rows = segment.rows_as_dicts()
+        if start or end:
+            rows = [row for row in rows if (not start or row['created_at'] >= start) and (not end or row['created_at'] < end)]
+        if rows:
+            yield rows
+
+
+def recover_pending(root=None):
+    # The delete is one transaction, so a sample of ids tells whether it committed before a crash.
+    promoted = discarded = 0
+    for path in segment_paths(root=root, pending=True):
+        with Segment(path) as segment:
+            sample = segment.column('id')[:100]
+        if ReportingEvent.objects.using('reporting').filter(id__in=sample).exists():
+            path.unlink()
+            discarded += 1
+        else:
+            promote(path)
+            promoted += 1
+    return promoted, discarded
+
+
+def funnel_summary(campaign_id, start=None, end=None, root=None):
+    hot = ReportingEvent.objects.using('reporting').filter(campaign_id=campaign_id)
+    if start:
+        hot = hot.filter(created_at__gte=start)
+    if end:
+        hot = hot.filter(created_at__lt=end)
+    if not any(segment_paths(campaign_id, start, end, root)):
+        return summarize_events(hot)
+    # Distinct doctors must be unioned with the archive, so the hot side comes back one row per doctor.
+    doctors = defaultdict(set)
+    total = 0
+    per_doctor = hot.order_by().values('doctor_id').annotate(events=Count('id'), **{metric: Count('id', filter=condition) for metric, condition in METRIC_FILTERS.items()})
+    for row in per_doctor.iterator():
+        total += row['events']
+        doctors['any'].add(row['doctor_id'])
+        for metric in METRIC_FILTERS:
+            if row[metric]:
+                doctors[metric].add(row['doctor_id'])
+    for segment in segments(campaign_id, start, end, root):
+        with segment:
+            low, high = segment.bounds()
+            if (not start or low >= start) and (not end or high < end):
+                total += segment.rows
+                for metric in METRICS:
+                    doctors[metric].update(segment.column(f'doctors:{metric}'))
+                continue
+            created = segment.column('created_at')
+            columns = zip(created, segment.column('doctor_id'), segment.column('event_type'), segment.column('video_percentage'))
+            for created_at, doctor_id, event_type, percentage in columns:
+                if (start and created_at < start) or (end and created_at >= end):
+                    continue
+                total += 1
+                for metric in _row_metrics(event_type, percentage):
+                    doctors[metric].add(doctor_id)
+    summary = {SUMMARY_KEYS[metric]: len(doctors[metric]) for metric in METRICS}
+    summary['total'] = total
+    return summary
+
+
+def report_funnel(campaign_id, start=None, end=None):
+    # Archiving promotes a segment only after its rows leave the hot table, so the segment count keys out a half-moved range.
+    archived = len(list(segment_paths(campaign_id, start, end)))
+    key = summary_key(campaign_id, 'funnel', start and start.isoformat(), end and end.isoformat(), archived)
+    return cached_report(key, lambda: funnel_summary(campaign_id, start, end))
+
+
+def archive_events(before, campaign_id=None, batch_size=20000, root=None):
+    recover_pending(root)
+    events = ReportingEvent.objects.using('reporting').filter(created_at__lt=before)
+    if campaign_id:
+        events = events.filter(campaign_id=campaign_id)
+    archived, written = 0, 0
+    for rows in iter_event_chunks(batch_size, events):
+        groups = defaultdict(list)
+        for row in rows:
+            groups[(row['campaign_id'], _month(row['created_at']))].append(row)
+        pending = [write_segment(campaign, month, group, root) for (campaign, month), group in groups.items()]
+        ids = [row['id'] for row in rows]
+        with transaction.atomic(using='reporting'):
+            for start in range(0, len(ids), DELETE_BATCH):
+                ReportingEvent.objects.using('reporting').filter(id__in=ids[start:start + DELETE_BATCH]).delete()
+        for path in pending:
+            promote(path)
+        archived += len(rows)
+        written += len(pending)
+    return archived, written
@@ -0,0 +1,106 @@
+import io
+import logging
+from pathlib import PurePosixPath
+from django.apps import apps
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+from pypdf import PdfReader
+from pypdf.errors import PyPdfError
+from .fragments import bump_fragment_version
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (480, 960, 1440)
+VARIANT_FORMATS = (('webp', 'WEBP', {'quality': 80, 'method': 4}), ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}))
+IMAGE_FIELDS = {'education.campaign': ('desktop_banner', 'mobile_banner'), 'education.collateral': ('banner_1', 'banner_2')}
+PDF_FIELDS = {'education.collateral': ('pdf_file',)}
+
+
+def _label(instance):
+    return instance._meta.label_lower
+
+
+def asset_fields(instance):
+    label = _label(instance)
+    return IMAGE_FIELDS.get(label, ()) + PDF_FIELDS.get(label, ())
+
+
+def needs_processing(instance):
+    # Processed metadata remembers which upload it describes, so a replaced file is picked up again.
+    return any(getattr(instance, name) and (instance.assets.get(name) or {}).get('source') != getattr(instance, name).name for name in asset_fields(instance))
+
+
+def image_variants(field_file):
+    field_file.open('rb')
+    try:
+        image = ImageOps.exif_transpose(Image.open(field_file))
+        image.load()
+    finally:
+        field_file.close()
+    stem = PurePosixPath(field_file.name).stem
+    widths = [width for width in VARIANT_WIDTHS if width < image.width] or [image.width]
+    variants = []
+    for width in widths:
+        height = round(image.height * width / image.width)
+        resized = image.resize((width, height), Image.LANCZOS)
+        for ext, fmt, options in VARIANT_FORMATS:
+            frame = resized.convert('RGB') if fmt == 'JPEG' or resized.mode not in ('RGB', 'RGBA') else resized
+            buffer = io.BytesIO()
+            frame.save(buffer, fmt, **options)
+            name = field_file.storage.save(f'variants/{stem}-{width}w.{ext}', ContentFile(buffer.getvalue()))
+            variants.append({'format': ext, 'width': width, 'height': height, 'bytes': buffer.tell(), 'name': name})
+    return {'source': field_file.name, 'width': image.width, 'height': image.height, 'bytes': field_file.size, 'variants': variants}
+
+
+def pdf_page_count(data):
+    # None means unknown: a file pypdf cannot parse gets no page count rather than a guessed one.
+    try:
+        return len(PdfReader(io.BytesIO(data)).pages)
+    except (PyPdfError, ValueError, KeyError):
+        return None
+
+
+def pdf_metadata(field_file):
+    field_file.open('rb')
+    try:
+        data = field_file.read()
+    finally:
+        field_file.close()
+    return {'source': field_file.name, 'bytes': len(data), 'pages': pdf_page_count(data)}
+
+
+def _discard(storage, meta):
+    for variant in (meta or {}).get('variants', ()):
+        storage.delete(variant['name'])
+
+
+def process_assets(label, pk, force=False):
+    from .resolver import resolver
+
+    model = apps.get_model(label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    assets = dict(instance.assets)
+    for name in asset_fields(instance):
+        field_file = getattr(instance, name)
+        current = assets.get(name)
+        if not field_file:
+            _discard(field_file.storage, current)
+            assets.pop(name, None)
+            continue
+        if current and current.get('source') == field_file.name and not force:
+            continue
+        try:
+            meta = pdf_metadata(field_file) if name in PDF_FIELDS.get(label, ()) else image_variants(field_file)
+        except (OSError, UnidentifiedImageError, Image.DecompressionBombError, ValueError) as exc:
+            logger.warning('asset_processing_failed model=%s pk=%s field=%s err=%s', label, pk, name, exc)
+            meta = {'source': field_file.name, 'error': str(exc)}
+        _discard(field_file.storage, current)
+        assets[name] = meta
+    # update() rather than save(): no post_save, so finishing a job cannot schedule another one.
+    model.objects.filter(pk=pk).update(assets=assets)
+    if label == 'education.collateral':
+        resolver.invalidate(collateral_id=pk)
+        bump_fragment_version(pk)
+    return assets
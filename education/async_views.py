@@ -0,0 +1,76 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect, render
+from .fragments import afragment_version
+from .ingest import aingest_event
+from .metrics import count_event, registry
+from .models import Event
+from .resolver import aresolve_share
+from .services import aensure_link_clicked, amark_engagement, arecord_video_progress
+from .views import _beacon_payload, _collateral_context
+
+# Doctor-facing endpoints on the async ORM. Session access and template rendering (whose context
+# processors load request.user) still touch the database synchronously, so they go through sync_to_async.
+arender = sync_to_async(render)
+
+
+async def _share_or_404(code):
+    share = await aresolve_share(code)
+    if share is None:
+        raise Http404('Unknown share code')
+    return share
+
+
+async def short_link(request, code):
+    share = await _share_or_404(code)
+    await aensure_link_clicked(share)
+    if request.method == 'POST':
+        if request.POST.get('phone') == share.doctor.whatsapp_number:
+            await amark_engagement(share, 'landing_access')
+            await Event.objects.acreate(
+                event_type='landing_access',
+                campaign_id=share.campaign_id,
+                collateral_id=share.collateral_id,
+                field_rep_id=share.field_rep_id,
+                doctor_id=share.doctor_id,
+                share_instance_id=share.id,
+            )
+            count_event('landing_access')
+            await sync_to_async(request.session.__setitem__)(f'verified_{share.id}', True)
+            return redirect('doctor_landing', code=code)
+        messages.error(request, 'Verification failed')
+    return await arender(request, 'education/doctor_verify.html', {'share': share})
+
+
+async def doctor_landing(request, code):
+    share = await _share_or_404(code)
+    if not await sync_to_async(request.session.get)(f'verified_{share.id}'):
+        return redirect('short_link', code=code)
+    return await arender(request, 'education/collateral_preview.html', _collateral_context(share.collateral, share, await afragment_version(share.collateral_id)))
+
+
+async def track_event(request, code):
+    share = await _share_or_404(code)
+    payload = _beacon_payload(request)
+    if payload is None:
+        return JsonResponse({'status': 'invalid'}, status=400)
+    kind, percentage = payload
+    if kind == 'video_progress':
+        percentage = await arecord_video_progress(share, percentage)
+        if percentage is None:
+            registry.inc('inclinic_video_pings_coalesced_total')
+            return JsonResponse({'status': 'coalesced'})
+    else:
+        await amark_engagement(share, kind)
+    await aingest_event(
+        event_type=kind,
+        campaign_id=share.campaign_id,
+        collateral_id=share.collateral_id,
+        field_rep_id=share.field_rep_id,
+        doctor_id=share.doctor_id,
+        share_instance_id=share.id,
+        video_percentage=percentage,
+    )
+    return JsonResponse({'status': 'queued' if settings.EVENT_INGEST_MODE == 'buffered' else 'ok'})
@@ -0,0 +1,153 @@
+import asyncio
+import io
+import random
+import resource
+import time
+import tracemalloc
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+from django.db import connections
+from django.db.models import Count
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from .fragments import bump_fragment_version, fragment_version
+from .importers import import_field_reps, read_field_rep_csv
+from .models import Campaign, Collateral, Doctor, FieldRep, ReportingEvent, ShareInstance
+from .rollups import campaign_summary, summarize_events
+from .services import create_share, doctor_statuses
+from .sync import run_sync
+from .views import _collateral_context
+
+ALIASES = ('default', 'reporting')
+
+
+def _traced(action):
+    tracemalloc.start()
+    try:
+        action()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(action, repeat=1, trace=True):
+    timings, result = [], None
+    for _ in range(repeat):
+        with ExitStack() as stack:
+            captured = {alias: stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in ALIASES}
+            started = time.perf_counter()
+            result = action()
+            timings.append(time.perf_counter() - started)
+    # tracemalloc slows Python code several-fold, so peak memory comes from a separate, untimed run.
+    peak = _traced(action) if trace else None
+    return {
+        'wall_ms': round(min(timings) * 1000, 3),
+        'wall_ms_mean': round(sum(timings) / len(timings) * 1000, 3),
+        'queries': {alias: len(captured[alias].captured_queries) for alias in ALIASES},
+        'peak_kb': round(peak / 1024, 1) if peak is not None else None,
+        'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'result': result,
+    }
+
+
+def _busiest_rep(campaign):
+    return FieldRep.objects.filter(campaign=campaign).annotate(doctor_count=Count('doctors')).order_by('-doctor_count').first()
+
+
+def _roster_csv(rows):
+    lines = ['brand-supplied-field-rep-id,field-rep-name,email-id,phone-number']
+    lines += [f'BENCH-CSV-{i},Imported Rep {i},imported{i}@bench.example.com,8{i:09d}' for i in range(rows)]
+    return io.BytesIO('\n'.join(lines).encode())
+
+
+def render_landing(share, cold=False):
+    # A cold render bumps the collateral's fragment version first, which is what the first doctor after an edit pays.
+    if cold:
+        bump_fragment_version(share.collateral_id)
+    context = _collateral_context(share.collateral, share, fragment_version(share.collateral_id))
+    return len(render_to_string('education/collateral_preview.html', context))
+
+
+def run_benchmarks(campaign, repeat=3, shares=50, csv_rows=2000, sync_chunk=500):
+    rep = _busiest_rep(campaign)
+    doctors = list(Doctor.objects.filter(field_rep=rep)[:shares])
+    collateral = Collateral.objects.filter(campaign=campaign).first()
+    results = {}
+    results['doctor_status'] = measure(lambda: len(doctor_statuses(rep, rep.doctors.all())), repeat)
+    results['create_share'] = measure(lambda: len([create_share(campaign, rep, doctor, collateral) for doctor in doctors]), 1, trace=False)
+    share = ShareInstance.objects.select_related('collateral').filter(collateral=collateral).first()
+    results['landing_render_uncached'] = measure(lambda: render_landing(share, cold=True), repeat)
+    results['landing_render_cached'] = measure(lambda: render_landing(share), repeat)
+
+    def import_roster():
+        result = import_field_reps(campaign, read_field_rep_csv(_roster_csv(csv_rows)))
+        return {'inserted': result.inserted, 'updated': result.updated, 'skipped': result.skipped}
+    results['csv_import'] = measure(import_roster, 1, trace=False)
+
+    def sync():
+        stats = run_sync(chunk_size=sync_chunk)
+        return {'transferred': stats.transferred, 'rows_per_second': round(stats.rows_per_second, 1)}
+    results['sync_reporting'] = measure(sync, 1, trace=False)
+    results['brand_reports_summary'] = measure(lambda: campaign_summary(campaign.id), repeat)
+    events = ReportingEvent.objects.using('reporting').filter(campaign_id=campaign.id)
+    results['brand_reports_raw_summary'] = measure(lambda: summarize_events(events), repeat)
+    return results
+
+
+def benchmark_campaign():
+    return Campaign.objects.annotate(share_count=Count('shareinstance')).order_by('-share_count').first()
+
+
+def doctor_paths(codes, count, seed=42):
+    rng = random.Random(seed)
+    paths = []
+    for _ in range(count):
+        code = rng.choice(codes)
+        paths.append(rng.choices([
+            f'/s/{code}/', f'/s/{code}/track/?type=video_progress&percentage={rng.choice([25, 50, 75, 100])}', f'/s/{code}/track/?type=pdf_last_page',
+        ], [1, 6, 2])[0])
+    return paths
+
+
+async def _get(host, port, path, timeout):
+    started = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    return int(status_line.split()[1]), time.perf_counter() - started
+
+
+async def _load(base_url, paths, concurrency, timeout):
+    parts = urlsplit(base_url)
+    gate = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def one(path):
+        async with gate:
+            try:
+                results.append(await _get(parts.hostname, parts.port or 80, path, timeout))
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                results.append((None, None))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(path) for path in paths))
+    return results, time.perf_counter() - started
+
+
+def run_load(base_url, codes, requests=2000, concurrency=100, timeout=30.0):
+    results, elapsed = asyncio.run(_load(base_url, doctor_paths(codes, requests), concurrency, timeout))
+    latencies = sorted(latency for status, latency in results if status and status < 400)
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2) if latencies else None
+    return {
+        'requests': len(results), 'ok': len(latencies), 'errors': len(results) - len(latencies), 'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3), 'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': pick(0.5), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99),
+    }
+
+
+def load_codes(campaign, count=200):
+    return list(ShareInstance.objects.filter(campaign=campaign).order_by('id').values_list('short_code', flat=True)[:count])
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+from .sharedcache import is_shared
+
+SHARED_CACHE_ALIASES = {
+    'ACCESS_CACHE_ALIAS': 'role and campaign scope are reloaded from the database on every request',
+    'SHARE_CACHE_ALIAS': 'short codes are resolved from the database on every request',
+}
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_caches(app_configs, **kwargs):
+    return [
+        Warning(
+            f'{name} points at a per-process cache, so {effect}.',
+            hint='Set CACHE_BACKEND to a shared backend such as django.core.cache.backends.redis.RedisCache.',
+            id='education.W001',
+        )
+        for name, effect in SHARED_CACHE_ALIASES.items() if not is_shared(getattr(settings, name))
+    ]
@@ -0,0 +1,82 @@
+import hashlib
+import uuid
+from dataclasses import dataclass
+from django.conf import settings
+from django.core.cache import caches
+from django.core.paginator import Paginator
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from .models import Collateral, Doctor, FieldRep, ShareInstance
+
+DASHBOARD_PAGE_SIZE = 25
+GENERATION_KEY = 'dashboard:generation'
+CAMPAIGN_FIELDS = ('id', 'brand_name', 'company_name', 'created_at', 'rep_count', 'doctor_count', 'collateral_count', 'last_activity')
+
+
+@dataclass
+class DashboardPage:
+    rows: list
+    number: int = 1
+    num_pages: int = 1
+    count: int = 0
+
+    @property
+    def has_previous(self):
+        return self.number > 1
+
+    @property
+    def has_next(self):
+        return self.number < self.num_pages
+
+
+def _cache():
+    return caches[settings.DASHBOARD_CACHE_ALIAS]
+
+
+def _count(model, **filters):
+    rows = model.objects.filter(campaign=OuterRef('pk'), **filters).order_by().values('campaign').annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(rows, output_field=IntegerField()), Value(0))
+
+
+def annotated_campaigns(queryset):
+    # Correlated subqueries rather than joins: counting over joined reps, doctors and collaterals would multiply rows.
+    last_share = ShareInstance.objects.filter(campaign=OuterRef('pk')).order_by('-created_at').values('created_at')[:1]
+    return queryset.annotate(
+        rep_count=_count(FieldRep), doctor_count=_count(Doctor), collateral_count=_count(Collateral, is_active=True),
+        last_activity=Subquery(last_share),
+    )
+
+
+def search_campaigns(queryset, search):
+    if not search:
+        return queryset
+    match = Q(brand_name__icontains=search) | Q(company_name__icontains=search)
+    try:
+        match |= Q(id=uuid.UUID(search))
+    except ValueError:
+        pass
+    return queryset.filter(match)
+
+
+def _generation():
+    return _cache().get_or_set(GENERATION_KEY, 0, None)
+
+
+def invalidate_dashboards():
+    try:
+        _cache().incr(GENERATION_KEY)
+    except ValueError:
+        _cache().set(GENERATION_KEY, 1, None)
+
+
+def dashboard_page(user_id, campaigns, search='', number=1):
+    number = int(number) if str(number).isdigit() and int(number) > 0 else 1
+    digest = hashlib.md5(search.encode()).hexdigest()
+    key = f'dashboard:{_generation()}:{user_id}:{digest}:{number}'
+    page = _cache().get(key)
+    if page is None:
+        rows = annotated_campaigns(search_campaigns(campaigns, search)).order_by('-created_at', 'id').values(*CAMPAIGN_FIELDS)
+        current = Paginator(rows, DASHBOARD_PAGE_SIZE).get_page(number)
+        page = DashboardPage(list(current.object_list), current.number, current.paginator.num_pages, current.paginator.count)
+        _cache().set(key, page, settings.DASHBOARD_CACHE_TIMEOUT)
+    return page
@@ -1,22 +1,29 @@
+from django.conf import settings
+from .replicas import read_alias, record_write
+
+
 class EducationRouter:
-    reporting_models = {'ReportingEvent'}
+    reporting_models = {'ReportingEvent', 'SyncState', 'EngagementRollup', 'EngagementDoctor'}
 
     def db_for_read(self, model, **hints):
         if model.__name__ in self.reporting_models:
             return 'reporting'
-        return 'default'
+        return read_alias()
 
     def db_for_write(self, model, **hints):
         if model.__name__ in self.reporting_models:
             return 'reporting'
+        record_write()
         return 'default'
 
     def allow_relation(self, obj1, obj2, **hints):
         return True
 
     def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.REPLICA_DATABASES:
+            return False
         if app_label != 'education':
             return None
-        if model_name == 'reportingevent':
+        if model_name in {name.lower() for name in self.reporting_models}:
             return db == 'reporting'
         return db == 'default'
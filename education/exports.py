@@ -0,0 +1,70 @@
+import csv
+import json
+import zlib
+from itertools import chain
+from django.core.serializers.json import DjangoJSONEncoder
+from .archive import iter_segment_rows
+from .models import ReportingEvent
+from .sync import SYNC_FIELDS, iter_event_chunks
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+
+
+class _Line:
+    def write(self, value):
+        return value
+
+
+def filtered_events(campaign_id, start=None, end=None, **filters):
+    events = ReportingEvent.objects.using('reporting').filter(campaign_id=campaign_id, **{name: value for name, value in filters.items() if value})
+    if start:
+        events = events.filter(created_at__gte=start)
+    if end:
+        events = events.filter(created_at__lt=end)
+    return events
+
+
+def archived_rows(campaign_id, start=None, end=None, **filters):
+    filters = {name: str(value) for name, value in filters.items() if value}
+    for rows in iter_segment_rows(campaign_id, start, end):
+        for row in rows:
+            if all(str(row[name]) == value for name, value in filters.items()):
+                yield row
+
+
+def _lines(rows, fmt):
+    if fmt == 'csv':
+        writer = csv.writer(_Line())
+        yield writer.writerow(SYNC_FIELDS)
+        for row in rows:
+            yield writer.writerow([row[field] for field in SYNC_FIELDS])
+    else:
+        for row in rows:
+            yield json.dumps({field: row[field] for field in SYNC_FIELDS}, cls=DjangoJSONEncoder) + '\n'
+
+
+def stream_events(queryset, fmt='csv', compress=False, archived=(), chunk_size=EXPORT_CHUNK_SIZE):
+    # Archived rows come first: they are all older than anything still in the hot table. Hot rows are read in
+    # (created_at, id) keyset pages, since mysqlclient buffers a whole result set even for .iterator().
+    rows = chain(archived, chain.from_iterable(iter_event_chunks(chunk_size, queryset)))
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    pending, size, first = [], 0, True
+    for line in _lines(rows, fmt):
+        pending.append(line)
+        size += len(line)
+        if size >= FLUSH_BYTES or first:
+            data = ''.join(pending).encode()
+            pending, size = [], 0
+            if compressor:
+                # Sync-flush the header line so the client gets its first bytes before the bulk of the query runs.
+                data = compressor.compress(data) + (compressor.flush(zlib.Z_SYNC_FLUSH) if first else b'')
+            first = False
+            if data:
+                yield data
+    data = ''.join(pending).encode()
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
@@ -1,7 +1,15 @@
-import csv
-from io import StringIO
 from django import forms
-from .models import Campaign, CampaignSystem, Collateral, FieldRep
+from .importers import read_field_rep_csv
+from .models import Campaign, CampaignSystem, Collateral, FieldRep, UserProfile
+
+
+class BrandManagerField(forms.ModelMultipleChoiceField):
+    def __init__(self, **kwargs):
+        queryset = UserProfile.objects.filter(role='brand_manager').select_related('user').order_by('user__username')
+        super().__init__(queryset=queryset, required=False, widget=forms.CheckboxSelectMultiple, **kwargs)
+
+    def label_from_instance(self, profile):
+        return profile.user.get_full_name() or profile.user.username
 
 
 class CampaignForm(forms.ModelForm):
@@ -9,12 +17,17 @@ class CampaignForm(forms.ModelForm):
         choices=CampaignSystem.SYSTEM_CHOICES,
         widget=forms.CheckboxSelectMultiple,
     )
+    brand_managers = BrandManagerField()
 
     class Meta:
         model = Campaign
         fields = ['company_name', 'brand_name', 'expected_doctors', 'contact_name', 'contact_phone', 'contact_email', 'desktop_banner', 'mobile_banner']
 
 
+class CampaignManagersForm(forms.Form):
+    brand_managers = BrandManagerField()
+
+
 class InClinicConfigForm(forms.ModelForm):
     class Meta:
         model = CampaignSystem
@@ -25,11 +38,7 @@ class FieldRepCSVUploadForm(forms.Form):
     csv_file = forms.FileField()
 
     def parse(self):
-        reader = csv.DictReader(StringIO(self.cleaned_data['csv_file'].read().decode()))
-        required = {'field-rep-name', 'email-id', 'phone-number', 'brand-supplied-field-rep-id'}
-        if set(reader.fieldnames or []) != required:
-            raise forms.ValidationError('CSV headers are invalid')
-        return list(reader)
+        return read_field_rep_csv(self.cleaned_data['csv_file'])
 
 
 class FieldRepForm(forms.ModelForm):
@@ -60,3 +69,39 @@ class ShareForm(forms.Form):
     doctor_name = forms.CharField(max_length=255)
     doctor_whatsapp = forms.CharField(min_length=10, max_length=10)
     collateral = forms.IntegerField()
+
+
+class BulkShareForm(forms.Form):
+    MAX_SHARES = 500
+
+    doctors = forms.ModelMultipleChoiceField(queryset=None, required=False, widget=forms.CheckboxSelectMultiple)
+    new_doctors = forms.CharField(required=False, widget=forms.Textarea(attrs={'rows': 3, 'placeholder': 'Dr Name, 9876543210'}))
+    collaterals = forms.ModelMultipleChoiceField(queryset=None, widget=forms.CheckboxSelectMultiple)
+
+    def __init__(self, *args, rep, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['doctors'].queryset = rep.doctors.all()
+        self.fields['collaterals'].queryset = Collateral.objects.filter(campaign=rep.campaign, is_active=True)
+        self.fields['doctors'].label_from_instance = lambda doctor: f'{doctor.name} ({doctor.whatsapp_number})'
+        self.fields['collaterals'].label_from_instance = lambda collateral: collateral.content_title
+
+    def clean_new_doctors(self):
+        entries = []
+        for number, line in enumerate(self.cleaned_data['new_doctors'].splitlines(), 1):
+            if not line.strip():
+                continue
+            name, _, phone = line.rpartition(',')
+            name, phone = name.strip(), phone.strip()
+            if not name or len(phone) != 10 or not phone.isdigit():
+                raise forms.ValidationError(f'Line {number}: expected "Name, 10-digit WhatsApp number".')
+            entries.append((name, phone))
+        return entries
+
+    def clean(self):
+        cleaned = super().clean()
+        doctors = len(cleaned.get('doctors') or ()) + len(cleaned.get('new_doctors') or ())
+        if not doctors and 'new_doctors' in cleaned:
+            raise forms.ValidationError('Select or add at least one doctor.')
+        if doctors * len(cleaned.get('collaterals') or ()) > self.MAX_SHARES:
+            raise forms.ValidationError(f'At most {self.MAX_SHARES} shares per batch.')
+        return cleaned
@@ -0,0 +1,22 @@
+from django.utils import timezone
+from .models import Collateral
+
+# The collateral's own updated_at versions its cached HTML: every save moves it forward in the database, so all
+# workers agree on it and a stale instance cannot write an old value back the way a cached counter could be reset.
+
+
+def _version(updated_at):
+    return int(updated_at.timestamp() * 1_000_000) if updated_at else 0
+
+
+def fragment_version(collateral_id):
+    return _version(Collateral.objects.filter(pk=collateral_id).values_list('updated_at', flat=True).first())
+
+
+async def afragment_version(collateral_id):
+    return _version(await Collateral.objects.filter(pk=collateral_id).values_list('updated_at', flat=True).afirst())
+
+
+def bump_fragment_version(collateral_id):
+    # For writes that bypass save(), such as asset processing's update().
+    Collateral.objects.filter(pk=collateral_id).update(updated_at=timezone.now())
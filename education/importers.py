@@ -0,0 +1,102 @@
+import csv
+import io
+from dataclasses import dataclass, field
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from .models import FieldRep
+
+FIELD_REP_COLUMNS = {'brand-supplied-field-rep-id': 'brand_rep_id', 'field-rep-name': 'name', 'email-id': 'email', 'phone-number': 'phone'}
+FIELD_REP_LIMITS = {'brand_rep_id': 64, 'name': 255, 'email': 254, 'phone': 20}
+UPDATABLE_FIELDS = ('name', 'email', 'phone')
+
+
+@dataclass
+class ImportResult:
+    inserted: int = 0
+    updated: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)
+
+
+def _file_error(exc):
+    if isinstance(exc, UnicodeDecodeError):
+        return ValidationError('CSV file is not UTF-8 text; nothing was imported')
+    return ValidationError(f'CSV file could not be parsed ({exc}); nothing was imported')
+
+
+def read_field_rep_csv(fileobj):
+    reader = csv.DictReader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+    try:
+        headers = set(reader.fieldnames or [])
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise _file_error(exc) from exc
+    if headers != set(FIELD_REP_COLUMNS):
+        raise ValidationError('CSV headers are invalid')
+    return reader
+
+
+def _clean_row(row):
+    values = {name: (row.get(column) or '').strip() for column, name in FIELD_REP_COLUMNS.items()}
+    for name, value in values.items():
+        if not value:
+            return None, f'{name} is required'
+        if len(value) > FIELD_REP_LIMITS[name]:
+            return None, f'{name} is longer than {FIELD_REP_LIMITS[name]} characters'
+    try:
+        validate_email(values['email'])
+    except ValidationError:
+        return None, 'email is invalid'
+    return values, None
+
+
+def _apply_chunk(campaign, chunk, result):
+    existing = {
+        rep.brand_rep_id: rep
+        for rep in FieldRep.objects.filter(campaign=campaign, brand_rep_id__in=[values['brand_rep_id'] for values in chunk])
+        .only('id', 'brand_rep_id', *UPDATABLE_FIELDS)
+    }
+    to_create, to_update = [], []
+    for values in chunk:
+        rep = existing.get(values['brand_rep_id'])
+        if rep is None:
+            to_create.append(FieldRep(campaign=campaign, **values))
+        elif any(getattr(rep, name) != values[name] for name in UPDATABLE_FIELDS):
+            for name in UPDATABLE_FIELDS:
+                setattr(rep, name, values[name])
+            to_update.append(rep)
+        else:
+            result.skipped += 1
+    FieldRep.objects.bulk_create(to_create)
+    FieldRep.objects.bulk_update(to_update, UPDATABLE_FIELDS)
+    result.inserted += len(to_create)
+    result.updated += len(to_update)
+
+
+def import_field_reps(campaign, rows, chunk_size=500):
+    # One transaction: a file that turns out to be unreadable past the first chunks imports nothing rather than a prefix.
+    try:
+        with transaction.atomic():
+            return _import_rows(campaign, rows, chunk_size)
+    except (UnicodeDecodeError, csv.Error) as exc:
+        raise _file_error(exc) from exc
+
+
+def _import_rows(campaign, rows, chunk_size):
+    result = ImportResult()
+    seen, chunk = set(), []
+    for line, row in enumerate(rows, start=2):
+        values, error = _clean_row(row)
+        if error is None and values['brand_rep_id'] in seen:
+            error = 'brand_rep_id is repeated in this file'
+        if error:
+            result.errors.append((line, error))
+            continue
+        seen.add(values['brand_rep_id'])
+        chunk.append(values)
+        if len(chunk) >= chunk_size:
+            _apply_chunk(campaign, chunk, result)
+            chunk = []
+    if chunk:
+        _apply_chunk(campaign, chunk, result)
+    return result
@@ -0,0 +1,212 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DataError, DatabaseError, IntegrityError, connections, transaction
+from django.utils.dateparse import parse_datetime
+from .metrics import count_event
+from .models import Event
+
+logger = logging.getLogger(__name__)
+
+SPOOL_SUFFIX = '.ndjson'
+QUARANTINE_DIR = 'quarantine'
+BAD_ROW_ERRORS = (DataError, IntegrityError, ValidationError, ValueError, TypeError)
+
+
+def _encode(event):
+    return json.dumps({
+        'id': str(event.id), 'event_type': event.event_type, 'campaign_id': str(event.campaign_id),
+        'collateral_id': event.collateral_id, 'field_rep_id': event.field_rep_id, 'doctor_id': event.doctor_id,
+        'share_instance_id': event.share_instance_id, 'video_percentage': event.video_percentage,
+        'created_at': event.created_at.isoformat(),
+    })
+
+
+def _decode(line):
+    row = json.loads(line)
+    row['created_at'] = parse_datetime(row['created_at'])
+    return Event(**row)
+
+
+def insert_events(events):
+    # Returns the events the database rejected; an unreachable database raises instead, so the caller keeps the batch.
+    try:
+        with transaction.atomic():
+            Event.objects.bulk_create(events, ignore_conflicts=True)
+        return []
+    except BAD_ROW_ERRORS:
+        pass
+    rejected = []
+    for event in events:
+        try:
+            with transaction.atomic():
+                Event.objects.bulk_create([event], ignore_conflicts=True)
+        except BAD_ROW_ERRORS:
+            rejected.append(event)
+    return rejected
+
+
+def quarantine(spool_dir, name, lines):
+    target = Path(spool_dir) / QUARANTINE_DIR
+    target.mkdir(parents=True, exist_ok=True)
+    with open(target / name, 'a', encoding='utf-8') as handle:
+        handle.writelines(line if line.endswith('\n') else line + '\n' for line in lines)
+    logger.error('spool_rows_quarantined spool=%s rows=%s', target / name, len(lines))
+
+
+class EventBuffer:
+    def __init__(self, spool_dir, max_size=200, max_age=2.0):
+        self.spool_dir = Path(spool_dir)
+        self.max_size = max_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._pending = []
+        self._first_at = None
+        self._spool = None
+        self._retry = []
+        self._flusher = None
+
+    def _open_spool(self):
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spool_dir / f'{os.getpid()}-{uuid.uuid4().hex}{SPOOL_SUFFIX}'
+        return path, open(path, 'a', encoding='utf-8')
+
+    def _append(self, event):
+        with self._lock:
+            if self._spool is None:
+                self._spool = self._open_spool()
+                self._first_at = time.monotonic()
+            self._spool[1].write(_encode(event) + '\n')
+            self._spool[1].flush()
+            self._pending.append(event)
+            due = len(self._pending) >= self.max_size or 0 < self.max_age <= time.monotonic() - self._first_at
+        self._ensure_flusher()
+        return due
+
+    def enqueue(self, event):
+        if self._append(event):
+            self.flush()
+
+    async def aenqueue(self, event):
+        # Appending to the spool is a short local write; only the flush needs the database.
+        if self._append(event):
+            await sync_to_async(self.flush)()
+
+    def _take(self):
+        with self._lock:
+            pending, spool = self._pending, self._spool
+            self._pending, self._spool, self._first_at = [], None, None
+        if spool:
+            spool[1].close()
+        return pending, spool[0] if spool else None
+
+    def flush(self):
+        with self._lock:
+            batches, self._retry = self._retry, []
+        batches.append(self._take())
+        flushed = 0
+        for events, path in batches:
+            if not events:
+                continue
+            try:
+                rejected = insert_events(events)
+            except DatabaseError as exc:
+                # Keep the batch; the flusher thread (or the next flush) tries it again while its spool file stays on disk.
+                logger.exception('event_flush_failed spool=%s size=%s err=%s', path, len(events), exc)
+                with self._lock:
+                    self._retry.append((events, path))
+                continue
+            if rejected:
+                quarantine(self.spool_dir, path.name, [_encode(event) for event in rejected])
+            path.unlink(missing_ok=True)
+            flushed += len(events) - len(rejected)
+        return flushed
+
+    def _ensure_flusher(self):
+        if self.max_age <= 0 or self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run_flusher, name='event-buffer-flusher', daemon=True)
+                self._flusher.start()
+
+    def _run_flusher(self):
+        while True:
+            time.sleep(self.max_age)
+            with self._lock:
+                due = bool(self._retry) or self._first_at is not None and time.monotonic() - self._first_at >= self.max_age
+            if due:
+                self.flush()
+                connections.close_all()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None or _buffer.spool_dir != Path(settings.EVENT_SPOOL_DIR):
+        with _buffer_lock:
+            if _buffer is None or _buffer.spool_dir != Path(settings.EVENT_SPOOL_DIR):
+                _buffer = EventBuffer(settings.EVENT_SPOOL_DIR, settings.EVENT_BUFFER_MAX_SIZE, settings.EVENT_BUFFER_MAX_AGE)
+                atexit.register(_buffer.flush)
+    return _buffer
+
+
+def ingest_event(**fields):
+    event = Event(**fields)
+    if settings.EVENT_INGEST_MODE == 'buffered':
+        get_buffer().enqueue(event)
+    else:
+        event.save(force_insert=True)
+    count_event(event.event_type)
+    return event
+
+
+async def aingest_event(**fields):
+    event = Event(**fields)
+    if settings.EVENT_INGEST_MODE == 'buffered':
+        await get_buffer().aenqueue(event)
+    else:
+        await event.asave(force_insert=True)
+    count_event(event.event_type)
+    return event
+
+
+def replay_spool(spool_dir, chunk_size=1000):
+    replayed = files = quarantined = 0
+    for path in sorted(Path(spool_dir).glob(f'*{SPOOL_SUFFIX}')):
+        events, bad = [], []
+        with open(path, encoding='utf-8') as spool:
+            for line in spool:
+                try:
+                    events.append(_decode(line))
+                except (ValueError, TypeError, KeyError):
+                    bad.append(line)
+        inserted = 0
+        try:
+            for start in range(0, len(events), chunk_size):
+                chunk = events[start:start + chunk_size]
+                rejected = insert_events(chunk)
+                inserted += len(chunk) - len(rejected)
+                bad += [_encode(event) for event in rejected]
+        except DatabaseError as exc:
+            # Leave the file for the next replay; replays are idempotent.
+            logger.exception('spool_replay_failed spool=%s err=%s', path, exc)
+            continue
+        if bad:
+            quarantine(spool_dir, path.name, bad)
+            quarantined += len(bad)
+        path.unlink()
+        replayed += inserted
+        files += 1
+    return files, replayed, quarantined
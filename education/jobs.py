@@ -0,0 +1,49 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connections, transaction
+from .assets import process_assets
+from .sync import acquire_lock, run_locked_sync
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+
+
+def _pool(name):
+    if name not in _executors:
+        workers = settings.ASSET_JOB_WORKERS if name == 'assets' else 1
+        _executors[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'{name}-job')
+    return _executors[name]
+
+
+def _run(func, *args, close_connections=True):
+    try:
+        return func(*args)
+    except Exception:
+        logger.exception('background_job_failed func=%s', func.__name__)
+    finally:
+        # Worker threads get their own connections; close them so idle jobs don't pin DB sessions.
+        if close_connections:
+            connections.close_all()
+
+
+def submit(func, *args, pool='sync'):
+    if settings.SYNC_JOB_EXECUTOR == 'inline':
+        return _run(func, *args, close_connections=False)
+    return _pool(pool).submit(_run, func, *args)
+
+
+def enqueue_sync(chunk_size=500):
+    owner = f'job:{uuid.uuid4().hex}'
+    if not acquire_lock(owner, status='queued'):
+        return None
+    submit(run_locked_sync, owner, chunk_size)
+    return owner
+
+
+def enqueue_assets(instance):
+    # Pillow releases the GIL while resizing and encoding, so a small thread pool really runs jobs in parallel.
+    label, pk = instance._meta.label_lower, instance.pk
+    transaction.on_commit(lambda: submit(process_assets, label, pk, pool='assets'))
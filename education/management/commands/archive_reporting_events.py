@@ -0,0 +1,22 @@
+from datetime import datetime, time
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from education.archive import archive_events
+
+
+class Command(BaseCommand):
+    help = 'Move reporting events older than --before into compressed per-campaign, per-month segment files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True, help='Archive events created before this date (YYYY-MM-DD).')
+        parser.add_argument('--campaign', help='Only archive this campaign id.')
+        parser.add_argument('--batch-size', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        try:
+            day = datetime.strptime(options['before'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('--before must be YYYY-MM-DD')
+        cutoff = timezone.make_aware(datetime.combine(day, time.min))
+        archived, segments = archive_events(cutoff, options['campaign'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'archived events={archived} segments={segments} before={cutoff.isoformat()}'))
@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from education.assets import needs_processing, process_assets
+from education.models import Campaign, Collateral
+
+
+def _process(label, pk, force):
+    try:
+        return process_assets(label, pk, force)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Generate banner variants and PDF metadata for campaigns and collaterals uploaded before the asset pipeline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Parallel image jobs.')
+        parser.add_argument('--force', action='store_true', help='Rebuild assets that are already processed.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        force = options['force']
+        jobs = [
+            (instance._meta.label_lower, instance.pk)
+            for model in (Campaign, Collateral)
+            for instance in model.objects.iterator()
+            if force or needs_processing(instance)
+        ]
+        if options['workers'] == 1:
+            results = [process_assets(label, pk, force) for label, pk in jobs]
+        else:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                results = list(pool.map(lambda job: _process(*job, force), jobs))
+        failed = sum(1 for assets in results for meta in (assets or {}).values() if 'error' in meta)
+        self.stdout.write(self.style.SUCCESS(f'assets processed objects={len(jobs)} failed_files={failed}'))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+from education.models import Event, ReportingEvent, ShareInstance
+from education.services import ENGAGEMENT_FIELDS
+
+
+def _merge_first(current, candidate):
+    return candidate if current is None or (candidate is not None and candidate < current) else current
+
+
+class Command(BaseCommand):
+    help = 'Fill ShareInstance engagement fields from Event and ReportingEvent rows recorded before they existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Share ids per pass.')
+
+    def handle(self, *args, **options):
+        batch = options['batch_size']
+        last_id = ShareInstance.objects.aggregate(last=Max('id'))['last'] or 0
+        sources = [Event.objects.all(), ReportingEvent.objects.using('reporting').all()]
+        fields = list(ENGAGEMENT_FIELDS.values()) + ['max_video_percent']
+        updated = 0
+        for start in range(0, last_id + 1, batch):
+            shares = {share.id: share for share in ShareInstance.objects.filter(id__gte=start, id__lt=start + batch).only(*fields)}
+            if not shares:
+                continue
+            changed = set()
+            for events in sources:
+                events = events.filter(share_instance_id__gte=start, share_instance_id__lt=start + batch)
+                firsts = events.filter(event_type__in=ENGAGEMENT_FIELDS).values('share_instance_id', 'event_type').annotate(first=Min('created_at'))
+                for row in firsts:
+                    share, field = shares.get(row['share_instance_id']), ENGAGEMENT_FIELDS[row['event_type']]
+                    if share and _merge_first(getattr(share, field), row['first']) != getattr(share, field):
+                        setattr(share, field, row['first'])
+                        changed.add(share.id)
+                videos = events.filter(event_type='video_progress').values('share_instance_id').annotate(top=Max('video_percentage'))
+                for row in videos:
+                    share = shares.get(row['share_instance_id'])
+                    if share and (row['top'] or 0) > share.max_video_percent:
+                        share.max_video_percent = min(row['top'], 100)
+                        changed.add(share.id)
+            ShareInstance.objects.bulk_update([shares[pk] for pk in changed], fields)
+            updated += len(changed)
+        self.stdout.write(self.style.SUCCESS(f'engagement backfilled shares={updated}'))
@@ -0,0 +1,39 @@
+import json
+import platform
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from education.benchmarks import benchmark_campaign, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Time ORM hot paths against seeded data and write wall time, query counts and peak memory to JSON. Moves events to reporting.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='bench_output.json')
+        parser.add_argument('--compare', help='Earlier bench JSON to print wall-time deltas against.')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--shares', type=int, default=50, help='create_share calls to time.')
+        parser.add_argument('--csv-rows', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        campaign = benchmark_campaign()
+        if campaign is None:
+            raise CommandError('No campaigns found. Run seed_benchmark first.')
+        results = run_benchmarks(campaign, repeat=options['repeat'], shares=options['shares'], csv_rows=options['csv_rows'])
+        report = {
+            'meta': {'at': timezone.now().isoformat(), 'vendor': connection.vendor, 'python': platform.python_version(), 'campaign': str(campaign.id)},
+            'results': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, default=str)
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as previous:
+                baseline = json.load(previous)['results']
+        for name, result in results.items():
+            line = f'{name:<26} wall={result["wall_ms"]:>10.2f}ms queries={result["queries"]} peak={result["peak_kb"] or "-"}KB maxrss={result["maxrss_kb"]}KB'
+            if name in baseline and baseline[name]['wall_ms']:
+                line += f' delta={(result["wall_ms"] / baseline[name]["wall_ms"] - 1) * 100:+.1f}%'
+            self.stdout.write(line)
+        self.stdout.write(self.style.SUCCESS(f'bench written to {options["output"]}'))
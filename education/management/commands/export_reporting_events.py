@@ -0,0 +1,44 @@
+import sys
+from datetime import datetime, time, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from education.exports import EXPORT_FORMATS, archived_rows, filtered_events, stream_events
+
+
+def _day(value, option):
+    try:
+        return timezone.make_aware(datetime.combine(datetime.strptime(value, '%Y-%m-%d').date(), time.min))
+    except ValueError:
+        raise CommandError(f'{option} must be YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Stream reporting events for a campaign as CSV or NDJSON to a file or stdout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_id')
+        parser.add_argument('--output', help='File to write; defaults to stdout.')
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--from', dest='start', help='First day to include (YYYY-MM-DD).')
+        parser.add_argument('--to', dest='end', help='Last day to include (YYYY-MM-DD).')
+        parser.add_argument('--rep', type=int, help='Field rep id.')
+        parser.add_argument('--collateral', type=int, help='Collateral id.')
+        parser.add_argument('--include-archive', action='store_true', help='Also export rows moved to archive segments.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        start = _day(options['start'], '--from') if options['start'] else None
+        end = _day(options['end'], '--to') + timedelta(days=1) if options['end'] else None
+        filters = {'field_rep_id': options['rep'], 'collateral_id': options['collateral']}
+        archived = archived_rows(options['campaign_id'], start, end, **filters) if options['include_archive'] else ()
+        chunks = stream_events(filtered_events(options['campaign_id'], start, end, **filters).order_by('created_at', 'id'), options['format'], options['gzip'], archived, options['chunk_size'])
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
+            else:
+                output.flush()
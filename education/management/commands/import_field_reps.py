@@ -0,0 +1,28 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from education.importers import import_field_reps, read_field_rep_csv
+from education.models import Campaign
+
+
+class Command(BaseCommand):
+    help = 'Stream a field rep roster CSV into a campaign, inserting new reps and updating changed ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('campaign_id')
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        campaign = Campaign.objects.filter(id=options['campaign_id']).first()
+        if campaign is None:
+            raise CommandError('Campaign not found')
+        with open(options['path'], 'rb') as fileobj:
+            try:
+                result = import_field_reps(campaign, read_field_rep_csv(fileobj), chunk_size=options['chunk_size'])
+            except ValidationError as exc:
+                raise CommandError(exc.messages[0])
+        for line, error in result.errors:
+            self.stderr.write(f'line={line} error={error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'import done inserted={result.inserted} updated={result.updated} skipped={result.skipped} rejected={len(result.errors)}'
+        ))
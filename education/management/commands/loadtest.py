@@ -0,0 +1,26 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from education.benchmarks import benchmark_campaign, load_codes, run_load
+
+
+class Command(BaseCommand):
+    help = 'Drive concurrent short-link and tracking requests at a running server and report throughput and latency percentiles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Base URL of the server under test, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=100)
+        parser.add_argument('--codes', type=int, default=200, help='Distinct seeded share codes to spread requests over.')
+        parser.add_argument('--label', default='', help='Name for this run in the output, e.g. wsgi or asgi.')
+        parser.add_argument('--output', help='Append the result as one JSON line to this file.')
+
+    def handle(self, *args, **options):
+        campaign = benchmark_campaign()
+        codes = load_codes(campaign, options['codes']) if campaign else []
+        if not codes:
+            raise CommandError('No shares found. Run seed_benchmark first.')
+        result = {'label': options['label'], **run_load(options['url'], codes, options['requests'], options['concurrency'])}
+        if options['output']:
+            with open(options['output'], 'a') as output:
+                output.write(json.dumps(result) + '\n')
+        self.stdout.write(' '.join(f'{key}={value}' for key, value in result.items()))
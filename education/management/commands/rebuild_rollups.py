@@ -0,0 +1,34 @@
+from itertools import chain
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from education.archive import funnel_summary, iter_segment_rows
+from education.models import ReportingEvent
+from education.rollups import apply_rollups, campaign_summary, clear_rollups, invalidate_summary
+from education.sync import iter_event_chunks
+
+
+class Command(BaseCommand):
+    help = 'Rebuild engagement rollup tables from raw reporting events and archived segments. Pause sync_reporting while this runs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--campaign', help='Only rebuild this campaign id.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--verify', action='store_true', help='Compare each rebuilt summary with a raw-event and archive aggregate.')
+
+    def handle(self, *args, **options):
+        campaign_id = options['campaign']
+        events = ReportingEvent.objects.using('reporting').all()
+        if campaign_id:
+            events = events.filter(campaign_id=campaign_id)
+        clear_rollups(campaign_id)
+        folded, campaigns = 0, {campaign_id} if campaign_id else set()
+        for rows in chain(iter_event_chunks(options['batch_size'], events), iter_segment_rows(campaign_id)):
+            with transaction.atomic(using='reporting'):
+                apply_rollups(rows)
+            folded += len(rows)
+            campaigns.update(str(row['campaign_id']) for row in rows)
+        for campaign in campaigns:
+            invalidate_summary(campaign)
+            if options['verify'] and campaign_summary(campaign) != funnel_summary(campaign):
+                self.stderr.write(f'rollup mismatch campaign={campaign}')
+        self.stdout.write(self.style.SUCCESS(f'rollups rebuilt events={folded} campaigns={len(campaigns)}'))
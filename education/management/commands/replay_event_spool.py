@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from education.ingest import replay_spool
+
+
+class Command(BaseCommand):
+    help = 'Insert events left in the write-behind spool by a stopped or crashed worker. Run before workers start.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spool-dir', default=settings.EVENT_SPOOL_DIR)
+
+    def handle(self, *args, **options):
+        files, replayed, quarantined = replay_spool(options['spool_dir'])
+        self.stdout.write(self.style.SUCCESS(f'spool replayed files={files} events={replayed} quarantined={quarantined}'))
@@ -0,0 +1,106 @@
+import random
+from datetime import timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from education.models import Campaign, CampaignSystem, Collateral, Doctor, Event, FieldRep, ShareInstance
+
+BENCH_USER = 'bench-publisher'
+CODE_ALPHABET = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+def zipf_weights(count, skew):
+    return [1 / (rank + 1) ** skew for rank in range(count)]
+
+
+class Command(BaseCommand):
+    help = 'Deterministically generate skewed campaigns, reps, doctors, collaterals, shares and events for benchmarking.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--campaigns', type=int, default=3)
+        parser.add_argument('--reps', type=int, default=50, help='Field reps per campaign.')
+        parser.add_argument('--doctors', type=int, default=30, help='Average doctors per rep (skewed across reps).')
+        parser.add_argument('--collaterals', type=int, default=5, help='Collaterals per campaign.')
+        parser.add_argument('--shares', type=int, default=5000, help='Shares per campaign.')
+        parser.add_argument('--events', type=int, default=4, help='Average engagement events per share.')
+        parser.add_argument('--days', type=int, default=60, help='Spread activity over this many past days.')
+        parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for rep and collateral popularity.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--reset', action='store_true', help='Delete campaigns from earlier seed runs first.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        publisher, _ = User.objects.get_or_create(username=BENCH_USER)
+        if options['reset']:
+            Campaign.objects.filter(created_by=publisher).delete()
+        now = timezone.now()
+        totals = dict.fromkeys(['campaigns', 'reps', 'doctors', 'collaterals', 'shares', 'events'], 0)
+        for number in range(options['campaigns']):
+            with transaction.atomic():
+                counts = self._seed_campaign(rng, publisher, number, now, options)
+            for key, value in counts.items():
+                totals[key] += value
+        self.stdout.write(self.style.SUCCESS('seeded ' + ' '.join(f'{key}={value}' for key, value in totals.items())))
+
+    def _seed_campaign(self, rng, publisher, number, now, options):
+        campaign = Campaign.objects.create(
+            company_name=f'Benchmark Co {number}', brand_name=f'Bench Brand {number}', expected_doctors=options['reps'] * options['doctors'],
+            contact_name='Bench', contact_phone='9000000000', contact_email='bench@example.com', created_by=publisher,
+        )
+        system = CampaignSystem.objects.create(campaign=campaign, system='inclinic', status='active')
+        FieldRep.objects.bulk_create([
+            FieldRep(campaign=campaign, brand_rep_id=f'B{number}-{i}', name=f'Rep {i}', email=f'rep{i}@bench.example.com', phone=f'9{i:09d}')
+            for i in range(options['reps'])
+        ])
+        reps = list(FieldRep.objects.filter(campaign=campaign).order_by('id'))
+        Collateral.objects.bulk_create([
+            Collateral(campaign=campaign, system=system, classification='doctor_long', content_title=f'Collateral {i}', item_type='both', vimeo_url=f'https://vimeo.com/{100000 + i}')
+            for i in range(options['collaterals'])
+        ])
+        collaterals = list(Collateral.objects.filter(campaign=campaign).order_by('id'))
+
+        rep_weights = zipf_weights(len(reps), options['skew'])
+        budget = len(reps) * options['doctors']
+        scale = budget / sum(rep_weights)
+        Doctor.objects.bulk_create([
+            Doctor(campaign=campaign, field_rep=rep, name=f'Dr {rep.id}-{i}', whatsapp_number=f'{rng.randrange(10 ** 9, 10 ** 10)}')
+            for rep, weight in zip(reps, rep_weights) for i in range(max(1, round(weight * scale)))
+        ], batch_size=1000)
+        doctors_by_rep = {}
+        for doctor in Doctor.objects.filter(campaign=campaign).only('id', 'field_rep_id'):
+            doctors_by_rep.setdefault(doctor.field_rep_id, []).append(doctor)
+
+        collateral_weights = zipf_weights(len(collaterals), options['skew'])
+        shares = []
+        for rep in rng.choices(reps, rep_weights, k=options['shares']):
+            shares.append(ShareInstance(
+                short_code=''.join(rng.choices(CODE_ALPHABET, k=12)), campaign=campaign, field_rep=rep,
+                doctor=rng.choice(doctors_by_rep[rep.id]), collateral=rng.choices(collaterals, collateral_weights)[0],
+            ))
+        ShareInstance.objects.bulk_create(shares, batch_size=1000)
+        shares = list(ShareInstance.objects.filter(campaign=campaign).order_by('id'))
+        for share in shares:
+            share.created_at = now - timedelta(seconds=rng.randrange(options['days'] * 86400))
+        ShareInstance.objects.bulk_update(shares, ['created_at'], batch_size=1000)
+
+        events = []
+        for share in shares:
+            engagement = [('share_initiated', None)]
+            if rng.random() < 0.6:
+                engagement.append(('link_clicked', None))
+                engagement.append(('landing_access', None))
+                for _ in range(rng.randrange(2 * options['events'])):
+                    kind = rng.choices(['video_progress', 'pdf_last_page', 'pdf_downloaded'], [6, 2, 1])[0]
+                    engagement.append((kind, rng.choice([25, 50, 75, 100]) if kind == 'video_progress' else None))
+            for offset, (kind, percentage) in enumerate(engagement):
+                events.append(Event(
+                    event_type=kind, campaign=campaign, collateral_id=share.collateral_id, field_rep_id=share.field_rep_id,
+                    doctor_id=share.doctor_id, share_instance=share, video_percentage=percentage,
+                    created_at=min(now, share.created_at + timedelta(minutes=offset * rng.randrange(1, 90))),
+                ))
+        Event.objects.bulk_create(events, batch_size=1000)
+        return {
+            'campaigns': 1, 'reps': len(reps), 'doctors': sum(len(group) for group in doctors_by_rep.values()),
+            'collaterals': len(collaterals), 'shares': len(shares), 'events': len(events),
+        }
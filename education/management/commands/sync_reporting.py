@@ -1,40 +1,29 @@
-import logging
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from education.models import Event, ReportingEvent
-
-logger = logging.getLogger(__name__)
+import os
+import socket
+from django.core.management.base import BaseCommand, CommandError
+from education.sync import acquire_lock, backlog, run_locked_sync
 
 
 class Command(BaseCommand):
-    help = 'Sync transaction events to reporting database in safe batches.'
+    help = 'Drain transaction events into the reporting database in keyset-ordered bulk chunks. Skips if another sync holds the lock.'
 
     def add_arguments(self, parser):
-        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--batch-size', type=int, default=500, help='Events moved per chunk.')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes; each claims disjoint chunks (SKIP LOCKED, or id ranges on SQLite).')
+        parser.add_argument('--time-budget', type=float, default=0, help='Stop after this many seconds (0 drains the whole backlog).')
 
     def handle(self, *args, **options):
-        batch_size = options['batch_size']
-        events = list(Event.objects.order_by('created_at')[:batch_size])
-        self.stdout.write(f'start sync count={len(events)}')
-        transferred = 0
-        for event in events:
-            try:
-                with transaction.atomic(using='reporting'):
-                    ReportingEvent.objects.using('reporting').get_or_create(
-                        id=event.id,
-                        defaults={
-                            'event_type': event.event_type,
-                            'campaign_id': event.campaign_id,
-                            'collateral_id': event.collateral_id,
-                            'field_rep_id': event.field_rep_id,
-                            'doctor_id': event.doctor_id,
-                            'share_instance_id': event.share_instance_id,
-                            'video_percentage': event.video_percentage,
-                            'created_at': event.created_at,
-                        }
-                    )
-                event.delete()
-                transferred += 1
-            except Exception as exc:
-                logger.exception('sync_failed event=%s err=%s', event.id, exc)
-        self.stdout.write(self.style.SUCCESS(f'end sync transferred={transferred} failed={len(events)-transferred}'))
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        owner = f'command:{socket.gethostname()}:{os.getpid()}'
+        if not acquire_lock(owner):
+            self.stdout.write('sync skipped: another run holds the reporting sync lock')
+            return
+        remaining, lag = backlog()
+        self.stdout.write(f'start sync backlog={remaining} lag={lag:.0f}s workers={options["workers"]}')
+        stats = run_locked_sync(owner, chunk_size=options['batch_size'], time_budget=options['time_budget'] or None, workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f'end sync transferred={stats.transferred} failed={stats.failed} batches={stats.batches} '
+            f'elapsed={stats.elapsed:.2f}s rate={stats.rows_per_second:.0f}rows/s '
+            f'remaining={stats.remaining} lag={stats.lag_seconds:.0f}s'
+        ))
@@ -0,0 +1,124 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.db.models.fields.files import FieldFile
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date
+from .streaming import streaming_content
+
+SHARE_ASSETS = {'pdf': 'pdf_file', 'banner_1': 'banner_1', 'banner_2': 'banner_2'}
+BANNER_SIZES = '(max-width: 992px) 100vw, 960px'
+RANGE_CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(stat):
+    # Same shape as nginx's ETag, so validators stay valid whichever side sends the bytes.
+    return f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+
+
+def _etag_matches(header, etag):
+    return header.strip() == '*' or etag in [value.strip().removeprefix('W/') for value in header.split(',')]
+
+
+def parse_range(header, size):
+    match = RANGE_RE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    return (start, end) if start <= end and start < size else False
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as handle:
+        handle.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = handle.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _cache_headers(response, etag, stat, filename):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = f'private, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable'
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(filename)}"
+    return response
+
+
+def serve_media(request, field_file):
+    try:
+        path = field_file.path
+        stat = os.stat(path)
+    except (FileNotFoundError, ValueError):
+        raise Http404('Missing file')
+    etag = file_etag(stat)
+    filename = field_file.name.rsplit('/', 1)[-1]
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if _etag_matches(request.headers.get('If-None-Match', ''), etag):
+        return _cache_headers(HttpResponse(status=304), etag, stat, filename)
+    if settings.MEDIA_ACCEL_REDIRECT:
+        # nginx serves the bytes (ranges included) from its internal location; this worker is free at once.
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT.rstrip('/') + '/' + quote(field_file.name)
+        return _cache_headers(response, etag, stat, filename)
+    byte_range = None
+    if 'Range' in request.headers and request.headers.get('If-Range', etag) == etag:
+        byte_range = parse_range(request.headers['Range'], stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    start, end = byte_range or (0, stat.st_size - 1)
+    response = StreamingHttpResponse(streaming_content(request, _read_range(path, start, end)), status=206 if byte_range else 200, content_type=content_type)
+    response['Content-Length'] = end - start + 1
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    return _cache_headers(response, etag, stat, filename)
+
+
+def _variants(instance, name):
+    meta = instance.assets.get(name) or {}
+    return meta, meta.get('variants', ()) if meta.get('source') == getattr(instance, name).name else ()
+
+
+def variant_file(instance, name, variant):
+    field_file = getattr(instance, name)
+    _, variants = _variants(instance, name)
+    for meta in variants:
+        if f"{meta['width']}w.{meta['format']}" == variant:
+            return FieldFile(instance, field_file.field, meta['name'])
+    return None
+
+
+def banner_sources(collateral, shared=False):
+    # Shared pages link relative to /s/<code>/landing/, so the cached landing fragment carries no share code.
+    banners = {}
+    for kind in ('banner_1', 'banner_2'):
+        field_file = getattr(collateral, kind)
+        if not field_file:
+            continue
+        meta, variants = _variants(collateral, kind)
+
+        def url(variant=None, kind=kind, field_file=field_file):
+            if not shared:
+                return field_file.storage.url(variant['name']) if variant else field_file.url
+            return f'../asset/{kind}/' + (f"{variant['width']}w.{variant['format']}/" if variant else '')
+
+        srcset = {fmt: ', '.join(f"{url(v)} {v['width']}w" for v in variants if v['format'] == fmt) for fmt in ('webp', 'jpeg')}
+        jpegs = [v for v in variants if v['format'] == 'jpeg']
+        banners[kind] = {
+            'src': url(jpegs[len(jpegs) // 2]) if jpegs else url(), 'webp': srcset['webp'], 'jpeg': srcset['jpeg'],
+            'sizes': BANNER_SIZES, 'width': meta.get('width'), 'height': meta.get('height'),
+        }
+    return banners
@@ -0,0 +1,93 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in (labels or {}).items()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(name, labels, value, extra=()):
+    pairs = list(labels) + list(extra)
+    rendered = '{' + ','.join(f'{key}="{_escape(val)}"' for key, val in pairs) + '}' if pairs else ''
+    return f'{name}{rendered} {value}'
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, labels=None, value=1):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] += value
+
+    def set(self, name, value, labels=None):
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name, value, labels=None, buckets=LATENCY_BUCKETS):
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': buckets, 'counts': [0] * (len(buckets) + 1), 'sum': 0.0}
+            histogram['counts'][bisect_left(buckets, value)] += 1
+            histogram['sum'] += value
+
+    def render(self, gauges=None):
+        with self._lock:
+            counters = dict(self._counters)
+            current = dict(self._gauges)
+            histograms = {key: {**value, 'counts': list(value['counts'])} for key, value in self._histograms.items()}
+        current.update({(name, _labels(labels)): value for name, labels, value in gauges or ()})
+        lines = []
+        for kind, samples in (('counter', counters), ('gauge', current)):
+            for name in sorted({name for name, _ in samples}):
+                lines += self._header(name, kind)
+                lines += [_format(name, labels, samples[(name, labels)]) for sample_name, labels in sorted(samples) if sample_name == name]
+        for name in sorted({name for name, _ in histograms}):
+            lines += self._header(name, 'histogram')
+            for (sample_name, labels), histogram in sorted(histograms.items()):
+                if sample_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram['buckets'] + ('+Inf',), histogram['counts']):
+                    cumulative += count
+                    lines.append(_format(f'{name}_bucket', labels, cumulative, [('le', str(bound))]))
+                lines.append(_format(f'{name}_sum', labels, histogram['sum']))
+                lines.append(_format(f'{name}_count', labels, cumulative))
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, name, kind):
+        kind, text = self._help.get(name, (kind, name.replace('_', ' ')))
+        return [f'# HELP {name} {text}', f'# TYPE {name} {kind}']
+
+
+registry = Registry()
+registry.describe('inclinic_request_duration_seconds', 'histogram', 'Request latency by URL name.')
+registry.describe('inclinic_requests_total', 'counter', 'Requests by URL name and status code.')
+registry.describe('inclinic_db_queries_total', 'counter', 'Database queries by URL name and database alias.')
+registry.describe('inclinic_db_seconds_total', 'counter', 'Time spent in database queries by URL name and database alias.')
+registry.describe('inclinic_events_ingested_total', 'counter', 'Engagement events accepted by type.')
+registry.describe('inclinic_video_pings_coalesced_total', 'counter', 'Video progress pings folded into the share running max without emitting an event.')
+registry.describe('inclinic_sync_rows_total', 'counter', 'Events moved to reporting by syncs run in this process.')
+registry.describe('inclinic_replica_fallback_total', 'counter', 'Replica-eligible requests sent to the primary because every replica was behind.')
+registry.describe('inclinic_replica_lag_seconds', 'gauge', 'Last measured heartbeat lag per read replica.')
+
+
+def count_event(kind, value=1):
+    registry.inc('inclinic_events_ingested_total', {'type': kind}, value)
@@ -0,0 +1,158 @@
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.functional import SimpleLazyObject
+from .access import access_for
+from .metrics import registry
+from .replicas import STICKY_COOKIE, beat, current_routing, routing
+
+METRIC_DATABASES = ('default', 'reporting', *settings.REPLICA_DATABASES)
+
+# Per-request timers live in a context variable rather than in per-connection wrappers: async views run their
+# queries on sync_to_async threads, which use other connection objects but inherit the request's context.
+_request_timers = ContextVar('inclinic_request_timers', default=None)
+
+
+class QueryTimer:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+def _timed_execute(execute, sql, params, many, context):
+    timers = _request_timers.get()
+    timer = timers.get(context['connection'].alias) if timers else None
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def _install_timer(connection, **kwargs):
+    if connection.alias in METRIC_DATABASES and _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+connection_created.connect(_install_timer)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            _install_timer(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timers = {alias: QueryTimer() for alias in METRIC_DATABASES}
+        token = _request_timers.set(timers)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_timers.reset(token)
+        self._record(request, response, timers, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        timers = {alias: QueryTimer() for alias in METRIC_DATABASES}
+        token = _request_timers.set(timers)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_timers.reset(token)
+        self._record(request, response, timers, time.perf_counter() - started)
+        return response
+
+    def _record(self, request, response, timers, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unresolved'
+        registry.observe('inclinic_request_duration_seconds', elapsed, {'view': view})
+        registry.inc('inclinic_requests_total', {'view': view, 'status': response.status_code})
+        for alias, timer in timers.items():
+            if timer.queries:
+                registry.inc('inclinic_db_queries_total', {'view': view, 'db': alias}, timer.queries)
+                registry.inc('inclinic_db_seconds_total', {'view': view, 'db': alias}, timer.seconds)
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        with routing() as state:
+            response = self.get_response(request)
+        return self._finish(response, state)
+
+    async def __acall__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return await self.get_response(request)
+        with routing() as state:
+            response = await self.get_response(request)
+        return self._finish(response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Mutated in place: under ASGI this hook runs in a sync_to_async thread with a copy of the context.
+        state = current_routing()
+        if state and getattr(view_func, 'replica_reads', False) and request.method in ('GET', 'HEAD') and STICKY_COOKIE not in request.COOKIES:
+            state.allowed = True
+
+    def _finish(self, response, state):
+        if state.wrote:
+            # Keep this client on the primary until replicas have had time to catch up with its write.
+            beat()
+            response.set_cookie(STICKY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+
+class AccessMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        self._attach(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self._attach(request)
+        return await self.get_response(request)
+
+    def _attach(self, request):
+        # Lazy, so requests that never check a role (doctor pages, beacons) skip the lookup entirely.
+        request.access = SimpleLazyObject(lambda: access_for(request.user))
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('watermark_at', models.DateTimeField(blank=True, null=True)),
+                ('watermark_id', models.UUIDField(blank=True, null=True)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('last_transferred', models.PositiveIntegerField(default=0)),
+                ('last_failed', models.PositiveIntegerField(default=0)),
+                ('last_rows_per_second', models.FloatField(default=0)),
+                ('last_remaining', models.PositiveIntegerField(default=0)),
+                ('last_lag_seconds', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.AlterModelOptions(
+            name='reportingevent',
+            options={'managed': True},
+        ),
+    ]
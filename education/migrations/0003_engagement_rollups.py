@@ -0,0 +1,48 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0002_sync_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EngagementDoctor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campaign_id', models.UUIDField()),
+                ('day', models.DateField()),
+                ('collateral_id', models.BigIntegerField()),
+                ('field_rep_id', models.BigIntegerField()),
+                ('doctor_id', models.BigIntegerField()),
+                ('metric', models.CharField(choices=[('any', 'Any Event'), ('clicked', 'Link Clicked'), ('downloaded', 'PDF Downloaded'), ('last_page', 'PDF Last Page'), ('video_50', 'Video 50%'), ('video_100', 'Video 100%')], max_length=16)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['campaign_id', 'metric', 'doctor_id'], name='engdoctor_campaign_metric')],
+                'unique_together': {('campaign_id', 'day', 'collateral_id', 'field_rep_id', 'doctor_id', 'metric')},
+            },
+        ),
+        migrations.CreateModel(
+            name='EngagementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('campaign_id', models.UUIDField()),
+                ('day', models.DateField()),
+                ('collateral_id', models.BigIntegerField()),
+                ('field_rep_id', models.BigIntegerField()),
+                ('events', models.PositiveIntegerField(default=0)),
+                ('clicked', models.PositiveIntegerField(default=0)),
+                ('downloaded', models.PositiveIntegerField(default=0)),
+                ('last_page', models.PositiveIntegerField(default=0)),
+                ('video_50', models.PositiveIntegerField(default=0)),
+                ('video_100', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('campaign_id', 'day', 'collateral_id', 'field_rep_id')},
+            },
+        ),
+    ]
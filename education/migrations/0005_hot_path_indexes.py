@@ -0,0 +1,37 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0004_event_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(fields=['field_rep', 'whatsapp_number'], name='doctor_rep_whatsapp'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['share_instance', 'event_type'], name='event_share_type'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['created_at', 'id'], name='event_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='reportingevent',
+            index=models.Index(fields=['campaign_id', 'event_type', 'doctor_id'], name='rptevent_campaign_type_doctor'),
+        ),
+        migrations.AddIndex(
+            model_name='reportingevent',
+            index=models.Index(fields=['created_at', 'id'], name='rptevent_created_id'),
+        ),
+        migrations.AddIndex(
+            model_name='shareinstance',
+            index=models.Index(fields=['field_rep', 'doctor', 'created_at'], name='share_rep_doctor_created'),
+        ),
+    ]
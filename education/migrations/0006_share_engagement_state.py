@@ -0,0 +1,38 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shareinstance',
+            name='downloaded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='shareinstance',
+            name='first_clicked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='shareinstance',
+            name='landing_verified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='shareinstance',
+            name='max_video_percent',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='shareinstance',
+            name='pdf_last_page_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0006_share_engagement_state'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reportingevent',
+            index=models.Index(fields=['campaign_id', 'created_at', 'id'], name='rptevent_campaign_created'),
+        ),
+        migrations.AddIndex(
+            model_name='reportingevent',
+            index=models.Index(fields=['campaign_id', 'event_type', 'created_at', 'id'], name='rptevent_campaign_type_time'),
+        ),
+        migrations.AddIndex(
+            model_name='reportingevent',
+            index=models.Index(fields=['campaign_id', 'field_rep_id', 'created_at', 'id'], name='rptevent_campaign_rep_time'),
+        ),
+        migrations.AddIndex(
+            model_name='reportingevent',
+            index=models.Index(fields=['campaign_id', 'collateral_id', 'created_at', 'id'], name='rptevent_campaign_coll_time'),
+        ),
+        migrations.AddIndex(
+            model_name='reportingevent',
+            index=models.Index(fields=['campaign_id', 'doctor_id', 'created_at', 'id'], name='rptevent_campaign_doc_time'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0009_replica_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shareinstance',
+            index=models.Index(fields=['campaign', 'created_at'], name='share_campaign_created'),
+        ),
+    ]
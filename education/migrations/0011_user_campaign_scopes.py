@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-18 14:59
+
+from django.db import migrations, models
+
+
+def grant_existing_brand_managers(apps, schema_editor):
+    # Brand managers could see every campaign before scopes existed; keep that until access is narrowed.
+    UserProfile = apps.get_model('education', 'UserProfile')
+    Campaign = apps.get_model('education', 'Campaign')
+    campaign_ids = list(Campaign.objects.values_list('id', flat=True))
+    for profile in UserProfile.objects.filter(role='brand_manager'):
+        profile.campaigns.add(*campaign_ids)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0010_dashboard_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='campaigns',
+            field=models.ManyToManyField(blank=True, related_name='managers', to='education.campaign'),
+        ),
+        migrations.RunPython(grant_existing_brand_managers, migrations.RunPython.noop),
+    ]
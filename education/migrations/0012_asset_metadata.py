@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0011_user_campaign_scopes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='assets',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='collateral',
+            name='assets',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
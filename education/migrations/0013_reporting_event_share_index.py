@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0012_asset_metadata'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reportingevent',
+            index=models.Index(fields=['share_instance_id', 'event_type'], name='rptevent_share_type'),
+        ),
+    ]
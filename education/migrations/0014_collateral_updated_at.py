@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('education', '0013_reporting_event_share_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collateral',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
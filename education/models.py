@@ -1,12 +1,14 @@
 import uuid
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 
 class UserProfile(models.Model):
     ROLE_CHOICES = [('publisher', 'Publisher'), ('brand_manager', 'Brand Manager')]
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     role = models.CharField(max_length=32, choices=ROLE_CHOICES)
+    campaigns = models.ManyToManyField('Campaign', blank=True, related_name='managers')
 
 
 class Campaign(models.Model):
@@ -19,6 +21,7 @@ class Campaign(models.Model):
     contact_email = models.EmailField()
     desktop_banner = models.FileField(upload_to='banners/', blank=True, null=True)
     mobile_banner = models.FileField(upload_to='banners/', blank=True, null=True)
+    assets = models.JSONField(default=dict, blank=True, editable=False)
     created_by = models.ForeignKey(User, on_delete=models.PROTECT)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -69,6 +72,9 @@ class Doctor(models.Model):
     clinic_name = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['field_rep', 'whatsapp_number'], name='doctor_rep_whatsapp')]
+
 
 class Collateral(models.Model):
     ITEM_CHOICES = [('pdf', 'PDF'), ('video', 'Video'), ('both', 'PDF + Video')]
@@ -95,6 +101,8 @@ class Collateral(models.Model):
     webinar_date = models.DateField(blank=True, null=True)
     whatsapp_template = models.TextField(default='Please review: $collateralLinks')
     is_active = models.BooleanField(default=True)
+    assets = models.JSONField(default=dict, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
 
 class ShareInstance(models.Model):
@@ -104,6 +112,17 @@ class ShareInstance(models.Model):
     field_rep = models.ForeignKey(FieldRep, on_delete=models.CASCADE)
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
+    first_clicked_at = models.DateTimeField(blank=True, null=True)
+    landing_verified_at = models.DateTimeField(blank=True, null=True)
+    pdf_last_page_at = models.DateTimeField(blank=True, null=True)
+    downloaded_at = models.DateTimeField(blank=True, null=True)
+    max_video_percent = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['field_rep', 'doctor', 'created_at'], name='share_rep_doctor_created'),
+            models.Index(fields=['campaign', 'created_at'], name='share_campaign_created'),
+        ]
 
 
 class Event(models.Model):
@@ -120,7 +139,13 @@ class Event(models.Model):
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE)
     share_instance = models.ForeignKey(ShareInstance, on_delete=models.CASCADE)
     video_percentage = models.PositiveIntegerField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['share_instance', 'event_type'], name='event_share_type'),
+            models.Index(fields=['created_at', 'id'], name='event_created_id'),
+        ]
 
 
 class ReportingEvent(models.Model):
@@ -136,3 +161,69 @@ class ReportingEvent(models.Model):
 
     class Meta:
         managed = True
+        indexes = [
+            models.Index(fields=['campaign_id', 'event_type', 'doctor_id'], name='rptevent_campaign_type_doctor'),
+            models.Index(fields=['created_at', 'id'], name='rptevent_created_id'),
+            models.Index(fields=['campaign_id', 'created_at', 'id'], name='rptevent_campaign_created'),
+            models.Index(fields=['campaign_id', 'event_type', 'created_at', 'id'], name='rptevent_campaign_type_time'),
+            models.Index(fields=['campaign_id', 'field_rep_id', 'created_at', 'id'], name='rptevent_campaign_rep_time'),
+            models.Index(fields=['campaign_id', 'collateral_id', 'created_at', 'id'], name='rptevent_campaign_coll_time'),
+            models.Index(fields=['campaign_id', 'doctor_id', 'created_at', 'id'], name='rptevent_campaign_doc_time'),
+            models.Index(fields=['share_instance_id', 'event_type'], name='rptevent_share_type'),
+        ]
+
+
+class SyncState(models.Model):
+    watermark_at = models.DateTimeField(blank=True, null=True)
+    watermark_id = models.UUIDField(blank=True, null=True)
+    last_run_at = models.DateTimeField(blank=True, null=True)
+    last_transferred = models.PositiveIntegerField(default=0)
+    last_failed = models.PositiveIntegerField(default=0)
+    last_rows_per_second = models.FloatField(default=0)
+    last_remaining = models.PositiveIntegerField(default=0)
+    last_lag_seconds = models.FloatField(default=0)
+    STATUS_CHOICES = [('idle', 'Idle'), ('queued', 'Queued'), ('running', 'Running'), ('failed', 'Failed')]
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='idle')
+    lock_owner = models.CharField(max_length=128, blank=True, default='')
+    lock_expires_at = models.DateTimeField(blank=True, null=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    rows_total = models.PositiveIntegerField(default=0)
+    rows_moved = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+
+class EngagementRollup(models.Model):
+    campaign_id = models.UUIDField()
+    day = models.DateField()
+    collateral_id = models.BigIntegerField()
+    field_rep_id = models.BigIntegerField()
+    events = models.PositiveIntegerField(default=0)
+    clicked = models.PositiveIntegerField(default=0)
+    downloaded = models.PositiveIntegerField(default=0)
+    last_page = models.PositiveIntegerField(default=0)
+    video_50 = models.PositiveIntegerField(default=0)
+    video_100 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('campaign_id', 'day', 'collateral_id', 'field_rep_id')
+
+
+class EngagementDoctor(models.Model):
+    METRIC_CHOICES = [
+        ('any', 'Any Event'), ('clicked', 'Link Clicked'), ('downloaded', 'PDF Downloaded'),
+        ('last_page', 'PDF Last Page'), ('video_50', 'Video 50%'), ('video_100', 'Video 100%')
+    ]
+    campaign_id = models.UUIDField()
+    day = models.DateField()
+    collateral_id = models.BigIntegerField()
+    field_rep_id = models.BigIntegerField()
+    doctor_id = models.BigIntegerField()
+    metric = models.CharField(max_length=16, choices=METRIC_CHOICES)
+
+    class Meta:
+        unique_together = ('campaign_id', 'day', 'collateral_id', 'field_rep_id', 'doctor_id', 'metric')
+        indexes = [models.Index(fields=['campaign_id', 'metric', 'doctor_id'], name='engdoctor_campaign_metric')]
+
+
+class ReplicaHeartbeat(models.Model):
+    beat_at = models.DateTimeField()
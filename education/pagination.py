@@ -0,0 +1,52 @@
+from dataclasses import dataclass
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_SALT = 'education.event-cursor'
+
+
+@dataclass
+class KeysetPage:
+    rows: list
+    next_cursor: str = None
+    prev_cursor: str = None
+
+
+def encode_cursor(row, direction):
+    return signing.dumps([row.created_at.isoformat(), str(row.id), direction], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        created_at, pk, direction = signing.loads(token, salt=CURSOR_SALT)
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    created_at = parse_datetime(created_at)
+    return (created_at, pk, direction) if created_at and direction in ('next', 'prev') else None
+
+
+def keyset_page(queryset, token=None, page_size=50):
+    # Newest first on (created_at, id), so every page is a bounded index range scan however deep it is.
+    cursor = decode_cursor(token)
+    if cursor is None:
+        rows = list(queryset.order_by('-created_at', '-id')[:page_size + 1])
+        more, earlier = len(rows) > page_size, False
+        rows = rows[:page_size]
+    else:
+        created_at, pk, direction = cursor
+        if direction == 'next':
+            rows = list(queryset.filter(Q(created_at__lte=created_at), Q(created_at__lt=created_at) | Q(id__lt=pk)).order_by('-created_at', '-id')[:page_size + 1])
+            more, earlier = len(rows) > page_size, True
+            rows = rows[:page_size]
+        else:
+            rows = list(queryset.filter(Q(created_at__gte=created_at), Q(created_at__gt=created_at) | Q(id__gt=pk)).order_by('created_at', 'id')[:page_size + 1])
+            earlier, more = len(rows) > page_size, True
+            rows = rows[:page_size][::-1]
+    return KeysetPage(
+        rows,
+        encode_cursor(rows[-1], 'next') if rows and more else None,
+        encode_cursor(rows[0], 'prev') if rows and earlier else None,
+    )
@@ -0,0 +1,104 @@
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = 'inclinic_primary'
+HEARTBEAT_INTERVAL = 1.0
+
+# Replica reads are opt-in per request: the middleware allows them for GET requests to views marked with
+# replica_reads, and the first write in a request pins the rest of it to the primary.
+_routing = ContextVar('inclinic_replica_routing', default=None)
+_lag = {}
+_last_beat = [0.0]
+
+
+class RoutingState:
+    def __init__(self, allowed=False):
+        self.allowed = allowed
+        self.wrote = False
+        self.alias = None
+
+
+def replica_reads(view):
+    view.replica_reads = True
+    return view
+
+
+@contextmanager
+def routing(allowed=False):
+    state = RoutingState(allowed)
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+def current_routing():
+    return _routing.get()
+
+
+def replica_lag(alias):
+    from .models import ReplicaHeartbeat
+
+    beats = ReplicaHeartbeat.objects.filter(pk=1).values_list('beat_at', flat=True)
+    primary = beats.using('default').first()
+    if primary is None:
+        return 0.0
+    replica = beats.using(alias).first()
+    return float('inf') if replica is None else max((primary - replica).total_seconds(), 0.0)
+
+
+def lag_for(alias):
+    now = time.monotonic()
+    checked = _lag.get(alias)
+    if checked is None or now - checked[0] >= settings.REPLICA_LAG_CHECK_INTERVAL:
+        try:
+            lag = replica_lag(alias)
+        except DatabaseError as exc:
+            logger.warning('replica_unavailable db=%s err=%s', alias, exc)
+            lag = float('inf')
+        checked = _lag[alias] = (now, lag)
+    return checked[1]
+
+
+def replica_stats():
+    return {alias: lag for alias, (_, lag) in _lag.items()}
+
+
+def read_alias():
+    state = _routing.get()
+    if state is None or not state.allowed or state.wrote:
+        return 'default'
+    if state.alias is None:
+        # One replica per request, so every read in it sees the same snapshot.
+        healthy = [alias for alias in settings.REPLICA_DATABASES if lag_for(alias) <= settings.REPLICA_MAX_LAG_SECONDS]
+        state.alias = random.choice(healthy) if healthy else 'default'
+        if not healthy:
+            registry.inc('inclinic_replica_fallback_total')
+    return state.alias
+
+
+def record_write():
+    state = _routing.get()
+    if state is not None:
+        state.wrote = True
+
+
+def beat():
+    from .models import ReplicaHeartbeat
+
+    now = time.monotonic()
+    if now - _last_beat[0] < HEARTBEAT_INTERVAL:
+        return
+    _last_beat[0] = now
+    if not ReplicaHeartbeat.objects.using('default').filter(pk=1).update(beat_at=timezone.now()):
+        ReplicaHeartbeat.objects.using('default').get_or_create(pk=1, defaults={'beat_at': timezone.now()})
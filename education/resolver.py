@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from .models import ShareInstance
+from .sharedcache import is_shared
+
+INVALIDATE_BATCH = 500
+
+
+def _key(code):
+    return f'share_resolver:{code}'
+
+
+class ShareResolver:
+    def __init__(self, maxsize=2048, timeout=600, cache_alias='default', local_ttl=5.0):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.cache_alias = cache_alias
+        self.local_ttl = local_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def enabled(self):
+        # Another worker's invalidation only reaches this one through a shared cache; without one, always read the row.
+        return is_shared(self.cache_alias)
+
+    def _local(self, code):
+        with self._lock:
+            entry = self._entries.get(code)
+            if entry and time.monotonic() - entry[0] < self.local_ttl:
+                self._entries.move_to_end(code)
+                self.counters['local_hits'] += 1
+                return entry[1]
+        return None
+
+    def _query(self, code):
+        return ShareInstance.objects.select_related('campaign', 'collateral', 'field_rep', 'doctor').filter(short_code=code)
+
+    def _remember(self, code, share):
+        with self._lock:
+            self._entries[code] = (time.monotonic(), share)
+            self._entries.move_to_end(code)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def resolve(self, code):
+        if not self.enabled:
+            self.counters['misses'] += 1
+            return self._query(code).first()
+        share = self._local(code)
+        if share is not None:
+            return share
+        share = self.cache.get(_key(code))
+        if share is not None:
+            self.counters['shared_hits'] += 1
+        else:
+            self.counters['misses'] += 1
+            share = self._query(code).first()
+            if share is None:
+                return None
+            self.cache.set(_key(code), share, self.timeout)
+        self._remember(code, share)
+        return share
+
+    async def aresolve(self, code):
+        if not self.enabled:
+            self.counters['misses'] += 1
+            return await self._query(code).afirst()
+        share = self._local(code)
+        if share is not None:
+            return share
+        share = await self.cache.aget(_key(code))
+        if share is not None:
+            self.counters['shared_hits'] += 1
+        else:
+            self.counters['misses'] += 1
+            share = await self._query(code).afirst()
+            if share is None:
+                return None
+            await self.cache.aset(_key(code), share, self.timeout)
+        self._remember(code, share)
+        return share
+
+    def invalidate_codes(self, codes):
+        codes = list(codes)
+        if self.enabled and codes:
+            self.cache.delete_many([_key(code) for code in codes])
+        with self._lock:
+            for code in codes:
+                self._entries.pop(code, None)
+        self.counters['invalidations'] += len(codes)
+
+    def invalidate(self, **filters):
+        # Drops only the shares matching filters (collateral_id=..., doctor_id=...); other workers' local copies age out within local_ttl.
+        if not self.enabled:
+            return
+        codes = ShareInstance.objects.filter(**filters).values_list('short_code', flat=True).iterator(chunk_size=INVALIDATE_BATCH)
+        batch = []
+        for code in codes:
+            batch.append(code)
+            if len(batch) == INVALIDATE_BATCH:
+                self.invalidate_codes(batch)
+                batch = []
+        self.invalidate_codes(batch)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return dict(self.counters, size=len(self._entries))
+
+
+resolver = ShareResolver(
+    maxsize=settings.SHARE_CACHE_SIZE,
+    timeout=settings.SHARE_CACHE_TIMEOUT,
+    cache_alias=settings.SHARE_CACHE_ALIAS,
+    local_ttl=settings.SHARE_CACHE_LOCAL_TTL,
+)
+
+
+def resolve_share(code):
+    return resolver.resolve(code)
+
+
+async def aresolve_share(code):
+    return await resolver.aresolve(code)
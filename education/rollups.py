@@ -0,0 +1,119 @@
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Max, Q, Subquery, Sum
+from django.utils import timezone
+from .models import EngagementDoctor, EngagementRollup, SyncState
+
+ROLLUP_METRICS = ('clicked', 'downloaded', 'last_page', 'video_50', 'video_100')
+SUMMARY_KEYS = {'any': 'unique_doctors', 'clicked': 'clicked', 'downloaded': 'downloads', 'last_page': 'last_page', 'video_50': 'video_50', 'video_100': 'video_100'}
+ROLLUP_KEY = ('campaign_id', 'day', 'collateral_id', 'field_rep_id')
+METRIC_FILTERS = {
+    'clicked': Q(event_type='link_clicked'),
+    'downloaded': Q(event_type='pdf_downloaded'),
+    'last_page': Q(event_type='pdf_last_page'),
+    'video_50': Q(event_type='video_progress', video_percentage__gte=50),
+    'video_100': Q(event_type='video_progress', video_percentage=100),
+}
+
+
+def event_metrics(event_type, video_percentage):
+    if event_type == 'link_clicked':
+        return ['clicked']
+    if event_type == 'pdf_downloaded':
+        return ['downloaded']
+    if event_type == 'pdf_last_page':
+        return ['last_page']
+    if event_type == 'video_progress':
+        percentage = video_percentage or 0
+        return ['video_50'] * (percentage >= 50) + ['video_100'] * (percentage == 100)
+    return []
+
+
+def apply_rollups(rows):
+    # Must run inside the reporting transaction that inserts `rows` so counters never drift from raw events.
+    if not rows:
+        return
+    counters = defaultdict(Counter)
+    members = set()
+    for row in rows:
+        key = (row['campaign_id'], timezone.localdate(row['created_at']), row['collateral_id'], row['field_rep_id'])
+        counters[key]['events'] += 1
+        members.add(key + (row['doctor_id'], 'any'))
+        for metric in event_metrics(row['event_type'], row['video_percentage']):
+            counters[key][metric] += 1
+            members.add(key + (row['doctor_id'], metric))
+
+    rollups = EngagementRollup.objects.using('reporting')
+    lookup = {field: {key[i] for key in counters} for i, field in enumerate(ROLLUP_KEY)}
+    existing = {
+        tuple(getattr(rollup, field) for field in ROLLUP_KEY): rollup
+        for rollup in rollups.select_for_update().filter(**{f'{field}__in': values for field, values in lookup.items()})
+    }
+    to_create, to_update = [], []
+    for key, counts in counters.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            to_create.append(EngagementRollup(**dict(zip(ROLLUP_KEY, key)), **counts))
+            continue
+        for field, value in counts.items():
+            setattr(rollup, field, getattr(rollup, field) + value)
+        to_update.append(rollup)
+    rollups.bulk_create(to_create)
+    rollups.bulk_update(to_update, ('events',) + ROLLUP_METRICS)
+    EngagementDoctor.objects.using('reporting').bulk_create(
+        [EngagementDoctor(**dict(zip(ROLLUP_KEY + ('doctor_id', 'metric'), member))) for member in members],
+        ignore_conflicts=True,
+    )
+
+
+def clear_rollups(campaign_id=None):
+    for model in (EngagementRollup, EngagementDoctor):
+        rows = model.objects.using('reporting').all()
+        if campaign_id:
+            rows = rows.filter(campaign_id=campaign_id)
+        rows.delete()
+
+
+def campaign_summary(campaign_id):
+    # One statement: the event total rides along as an uncorrelated subquery, which the database evaluates once.
+    total = EngagementRollup.objects.using('reporting').filter(campaign_id=campaign_id).order_by().values('campaign_id').annotate(total=Sum('events')).values('total')
+    summary = EngagementDoctor.objects.using('reporting').filter(campaign_id=campaign_id).aggregate(
+        **{key: Count('doctor_id', distinct=True, filter=Q(metric=metric)) for metric, key in SUMMARY_KEYS.items()},
+        total=Max(Subquery(total)),
+    )
+    summary['total'] = summary['total'] or 0
+    return summary
+
+
+def summarize_events(events):
+    return events.aggregate(
+        unique_doctors=Count('doctor_id', distinct=True),
+        **{SUMMARY_KEYS[metric]: Count('doctor_id', distinct=True, filter=condition) for metric, condition in METRIC_FILTERS.items()},
+        total=Count('id'),
+    )
+
+
+def _report_cache():
+    return caches[settings.REPORT_CACHE_ALIAS]
+
+
+def summary_key(campaign_id, *parts):
+    watermark = SyncState.objects.using('reporting').filter(pk=1).values_list('watermark_id', flat=True).first()
+    return ':'.join(['brand_report', str(campaign_id), str(watermark), *map(str, parts)])
+
+
+def cached_report(key, compute):
+    summary = _report_cache().get(key)
+    if summary is None:
+        summary = compute()
+        _report_cache().set(key, summary, settings.REPORT_CACHE_TIMEOUT)
+    return summary
+
+
+def report_summary(campaign_id):
+    return cached_report(summary_key(campaign_id), lambda: campaign_summary(campaign_id))
+
+
+def invalidate_summary(campaign_id):
+    _report_cache().delete(summary_key(campaign_id))
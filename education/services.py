@@ -1,13 +1,25 @@
 import secrets
 from datetime import timedelta
 from urllib.parse import quote
+from django.db import IntegrityError, connection, transaction
+from django.db.models import OuterRef, Subquery
 from django.utils import timezone
+from .metrics import count_event
 from .models import Doctor, Event, ShareInstance
 
+SHORT_CODE_BYTES = 9
+SHARE_BATCH_ATTEMPTS = 3
+VIDEO_MILESTONES = (25, 50, 75, 100)
+
+
+def whatsapp_link(share, doctor, collateral):
+    msg = collateral.whatsapp_template.replace('$collateralLinks', f'https://example.com/s/{share.short_code}/')
+    return f'https://api.whatsapp.com/send?phone={doctor.whatsapp_number}&text={quote(msg)}'
+
 
 def create_share(campaign, field_rep, doctor, collateral):
     share = ShareInstance.objects.create(
-        short_code=secrets.token_urlsafe(8)[:12],
+        short_code=generate_short_codes(1)[0],
         campaign=campaign,
         collateral=collateral,
         field_rep=field_rep,
@@ -21,29 +33,180 @@ def create_share(campaign, field_rep, doctor, collateral):
         doctor=doctor,
         share_instance=share,
     )
-    msg = collateral.whatsapp_template.replace('$collateralLinks', f'https://example.com/s/{share.short_code}/')
-    return share, f'https://api.whatsapp.com/send?phone={doctor.whatsapp_number}&text={quote(msg)}'
+    count_event('share_initiated')
+    return share, whatsapp_link(share, doctor, collateral)
 
 
-def doctor_status(field_rep, doctor):
-    latest_share = ShareInstance.objects.filter(field_rep=field_rep, doctor=doctor).order_by('-created_at').first()
-    if not latest_share:
+def generate_short_codes(count):
+    # 9 random bytes give 12 url-safe characters; collisions are rare enough that one IN query settles a whole batch.
+    codes = set()
+    while True:
+        while len(codes) < count:
+            codes.add(secrets.token_urlsafe(SHORT_CODE_BYTES))
+        taken = set(ShareInstance.objects.filter(short_code__in=codes).values_list('short_code', flat=True))
+        if not taken:
+            return list(codes)
+        codes -= taken
+
+
+def ensure_doctors(field_rep, entries):
+    # entries: (name, whatsapp_number) pairs; one lookup for the numbers already on this rep's list, one bulk insert for the rest.
+    entries = dict((number, name) for name, number in entries)
+    existing = {doctor.whatsapp_number: doctor for doctor in field_rep.doctors.filter(whatsapp_number__in=entries)}
+    missing = [Doctor(campaign_id=field_rep.campaign_id, field_rep=field_rep, name=name, whatsapp_number=number) for number, name in entries.items() if number not in existing]
+    if missing:
+        Doctor.objects.bulk_create(missing)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            missing = list(field_rep.doctors.filter(whatsapp_number__in=[doctor.whatsapp_number for doctor in missing]))
+    return list(existing.values()) + missing
+
+
+def create_shares(campaign, field_rep, doctors, collaterals):
+    pairs = [(doctor, collateral) for doctor in doctors for collateral in collaterals]
+    if not pairs:
+        return []
+    for attempt in range(1, SHARE_BATCH_ATTEMPTS + 1):
+        shares = [
+            ShareInstance(short_code=code, campaign=campaign, collateral=collateral, field_rep=field_rep, doctor=doctor)
+            for code, (doctor, collateral) in zip(generate_short_codes(len(pairs)), pairs)
+        ]
+        try:
+            with transaction.atomic():
+                ShareInstance.objects.bulk_create(shares)
+                if not connection.features.can_return_rows_from_bulk_insert:
+                    ids = dict(ShareInstance.objects.filter(short_code__in=[share.short_code for share in shares]).values_list('short_code', 'id'))
+                    for share in shares:
+                        share.id = ids[share.short_code]
+                Event.objects.bulk_create([
+                    Event(event_type='share_initiated', campaign=campaign, collateral=share.collateral, field_rep=field_rep, doctor=share.doctor, share_instance=share)
+                    for share in shares
+                ])
+            break
+        except IntegrityError:
+            # A concurrent batch claimed one of the codes between the check and the insert; draw a fresh set.
+            if attempt == SHARE_BATCH_ATTEMPTS:
+                raise
+    count_event('share_initiated', len(shares))
+    return [(share, whatsapp_link(share, share.doctor, share.collateral)) for share in shares]
+
+
+ENGAGEMENT_FIELDS = {
+    'link_clicked': 'first_clicked_at',
+    'landing_access': 'landing_verified_at',
+    'pdf_last_page': 'pdf_last_page_at',
+    'pdf_downloaded': 'downloaded_at',
+}
+
+
+def _engagement_change(share, kind, percentage):
+    # Returns (filter, update) for the conditional UPDATE that records this engagement, or None if there is nothing new.
+    if kind == 'video_progress':
+        if not percentage or share.max_video_percent >= percentage:
+            return None
+        return {'max_video_percent__lt': percentage}, {'max_video_percent': percentage}
+    field = ENGAGEMENT_FIELDS.get(kind)
+    if field is None or getattr(share, field) is not None:
+        return None
+    return {f'{field}__isnull': True}, {field: timezone.now()}
+
+
+def _apply_change(share, values, changed):
+    if changed:
+        for field, value in values.items():
+            setattr(share, field, value)
+    return changed == 1
+
+
+def mark_engagement(share, kind, percentage=None):
+    change = _engagement_change(share, kind, percentage)
+    if change is None:
+        return False
+    conditions, values = change
+    return _apply_change(share, values, ShareInstance.objects.filter(pk=share.id, **conditions).update(**values))
+
+
+async def amark_engagement(share, kind, percentage=None):
+    change = _engagement_change(share, kind, percentage)
+    if change is None:
+        return False
+    conditions, values = change
+    return _apply_change(share, values, await ShareInstance.objects.filter(pk=share.id, **conditions).aupdate(**values))
+
+
+def video_milestone(percentage):
+    return max((milestone for milestone in VIDEO_MILESTONES if milestone <= percentage), default=None)
+
+
+def _progress_steps(share, percentage):
+    # Conditional UPDATEs to try in order: the one that lifts the running max across a milestone owns that milestone's event.
+    if share.max_video_percent >= percentage:
+        return []
+    milestone = video_milestone(percentage)
+    claim = [(milestone, {'max_video_percent__lt': milestone})] if milestone and share.max_video_percent < milestone else []
+    return claim + [(None, {'max_video_percent__lt': percentage})]
+
+
+def record_video_progress(share, percentage):
+    for milestone, conditions in _progress_steps(share, percentage):
+        if ShareInstance.objects.filter(pk=share.id, **conditions).update(max_video_percent=percentage):
+            share.max_video_percent = percentage
+            return milestone
+    return None
+
+
+async def arecord_video_progress(share, percentage):
+    for milestone, conditions in _progress_steps(share, percentage):
+        if await ShareInstance.objects.filter(pk=share.id, **conditions).aupdate(max_video_percent=percentage):
+            share.max_video_percent = percentage
+            return milestone
+    return None
+
+
+def _status(latest_share_at, clicked, reminder_before):
+    if latest_share_at is None:
         return 'Send Message'
-    clicked = Event.objects.filter(share_instance=latest_share, event_type='link_clicked').exists()
     if clicked:
         return 'Read'
-    if latest_share.created_at < timezone.now() - timedelta(days=6):
+    if latest_share_at < reminder_before:
         return 'Send Reminder'
     return 'Sent'
 
 
+def doctor_statuses(field_rep, doctors):
+    latest = ShareInstance.objects.filter(field_rep=field_rep, doctor=OuterRef('pk')).order_by('-created_at', '-id')
+    doctors = doctors.annotate(
+        latest_share_at=Subquery(latest.values('created_at')[:1]),
+        latest_share_clicked_at=Subquery(latest.values('first_clicked_at')[:1]),
+    )
+    reminder_before = timezone.now() - timedelta(days=6)
+    return [(doctor, _status(doctor.latest_share_at, doctor.latest_share_clicked_at is not None, reminder_before)) for doctor in doctors]
+
+
+def doctor_status(field_rep, doctor):
+    return doctor_statuses(field_rep, Doctor.objects.filter(pk=doctor.pk))[0][1]
+
+
 def ensure_link_clicked(share):
-    if not Event.objects.filter(share_instance=share, event_type='link_clicked').exists():
+    if mark_engagement(share, 'link_clicked'):
         Event.objects.create(
             event_type='link_clicked',
-            campaign=share.campaign,
-            collateral=share.collateral,
-            field_rep=share.field_rep,
-            doctor=share.doctor,
-            share_instance=share,
+            campaign_id=share.campaign_id,
+            collateral_id=share.collateral_id,
+            field_rep_id=share.field_rep_id,
+            doctor_id=share.doctor_id,
+            share_instance_id=share.id,
+        )
+        count_event('link_clicked')
+
+
+async def aensure_link_clicked(share):
+    if await amark_engagement(share, 'link_clicked'):
+        await Event.objects.acreate(
+            event_type='link_clicked',
+            campaign_id=share.campaign_id,
+            collateral_id=share.collateral_id,
+            field_rep_id=share.field_rep_id,
+            doctor_id=share.doctor_id,
+            share_instance_id=share.id,
         )
+        count_event('link_clicked')
@@ -0,0 +1,8 @@
+from django.conf import settings
+
+PER_PROCESS_BACKENDS = {'django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache'}
+
+
+def is_shared(alias):
+    # An invalidation written to a per-process backend never reaches the other workers.
+    return settings.CACHES[alias]['BACKEND'] not in PER_PROCESS_BACKENDS
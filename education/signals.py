@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .access import invalidate_access
+from .assets import needs_processing
+from .dashboards import invalidate_dashboards
+from .jobs import enqueue_assets
+from .models import Campaign, Collateral, Doctor, ShareInstance, UserProfile
+from .resolver import resolver
+
+
+@receiver(post_save, sender=Collateral)
+def invalidate_resolved_shares_on_collateral_save(sender, instance, created=False, **kwargs):
+    if not created:
+        resolver.invalidate(collateral_id=instance.pk)
+
+
+@receiver(post_save, sender=Doctor)
+def invalidate_resolved_shares_on_doctor_save(sender, instance, created=False, **kwargs):
+    if not created:
+        resolver.invalidate(doctor_id=instance.pk)
+
+
+@receiver(post_delete, sender=ShareInstance)
+def invalidate_resolved_share_on_delete(sender, instance, **kwargs):
+    # Deleting a collateral or doctor cascades here share by share.
+    resolver.invalidate_codes([instance.short_code])
+
+
+@receiver(post_save, sender=Campaign)
+@receiver(post_delete, sender=Campaign)
+def invalidate_dashboards_on_change(sender, instance, created=False, **kwargs):
+    invalidate_dashboards()
+    if created:
+        invalidate_access(instance.created_by_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_access_on_user_change(sender, instance, **kwargs):
+    invalidate_access(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_access_on_profile_change(sender, instance, **kwargs):
+    invalidate_access(instance.user_id)
+
+
+@receiver(m2m_changed, sender=UserProfile.campaigns.through)
+def invalidate_access_on_scope_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        invalidate_access(instance.user_id)
+    else:
+        profiles = UserProfile.objects.filter(pk__in=pk_set) if pk_set else instance.managers.all()
+        invalidate_access(*profiles.values_list('user_id', flat=True))
+    invalidate_dashboards()
+
+
+@receiver(post_save, sender=Campaign)
+@receiver(post_save, sender=Collateral)
+def schedule_asset_processing(sender, instance, **kwargs):
+    if needs_processing(instance):
+        enqueue_assets(instance)
+
@@ -0,0 +1,16 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+_DONE = object()
+
+
+async def _aiter(iterator):
+    iterator = iter(iterator)
+    step = sync_to_async(next)
+    while (chunk := await step(iterator, _DONE)) is not _DONE:
+        yield chunk
+
+
+def streaming_content(request, iterator):
+    # Under ASGI, Django drains a sync iterator with sync_to_async(list) before sending a byte; hand it one chunk at a time instead.
+    return _aiter(iterator) if isinstance(request, ASGIRequest) else iterator
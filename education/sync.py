@@ -0,0 +1,272 @@
+import logging
+import multiprocessing
+import queue
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from .metrics import registry
+from .models import Event, ReportingEvent, SyncState
+from .rollups import apply_rollups
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_ATTEMPTS = 6
+SYNC_FIELDS = ('id', 'event_type', 'campaign_id', 'collateral_id', 'field_rep_id', 'doctor_id', 'share_instance_id', 'video_percentage', 'created_at')
+
+
+@dataclass
+class SyncStats:
+    transferred: int = 0
+    failed: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+    remaining: int = 0
+    lag_seconds: float = 0.0
+    watermark: tuple = None
+
+    @property
+    def rows_per_second(self):
+        return self.transferred / self.elapsed if self.elapsed else 0.0
+
+
+def _after(watermark):
+    created_at, pk = watermark
+    return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+
+
+def iter_event_chunks(chunk_size, queryset=None):
+    queryset = Event.objects.all() if queryset is None else queryset
+    watermark = None
+    while True:
+        page = queryset.order_by('created_at', 'id')
+        if watermark:
+            page = page.filter(_after(watermark))
+        rows = list(page.values(*SYNC_FIELDS)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        watermark = (rows[-1]['created_at'], rows[-1]['id'])
+
+
+def transfer_chunk(rows):
+    reporting = ReportingEvent.objects.using('reporting')
+    # Read before the transaction opens: on SQLite a read-then-write transaction cannot wait for a concurrent writer.
+    # Workers own disjoint rows, and a duplicate insert raises IntegrityError, which the caller retries.
+    synced = set(reporting.filter(id__in=[row['id'] for row in rows]).values_list('id', flat=True))
+    fresh = [row for row in rows if row['id'] not in synced]
+    with transaction.atomic(using='reporting'):
+        reporting.bulk_create([ReportingEvent(**row) for row in fresh])
+        apply_rollups(fresh)
+    # A savepoint inside sync_worker's claim: a failed attempt rolls back only itself, so the retry runs in a usable transaction.
+    with transaction.atomic():
+        Event.objects.filter(id__in=[row['id'] for row in rows]).delete()
+
+
+def backlog(queryset=None):
+    queryset = Event.objects.all() if queryset is None else queryset
+    state = queryset.aggregate(remaining=Count('id'), oldest=Min('created_at'))
+    lag = (timezone.now() - state['oldest']).total_seconds() if state['oldest'] else 0.0
+    return state['remaining'], lag
+
+
+def _move(rows, stats, attempts=TRANSFER_ATTEMPTS):
+    for attempt in range(1, attempts + 1):
+        try:
+            transfer_chunk(rows)
+            break
+        except (IntegrityError, OperationalError) as exc:
+            # Concurrent workers can race on a new rollup key or a busy database; the chunk is safe to replay.
+            if attempt == attempts:
+                stats.failed += len(rows)
+                logger.exception('sync_chunk_failed first=%s size=%s err=%s', rows[0]['id'], len(rows), exc)
+                return False
+            time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+        except Exception as exc:
+            stats.failed += len(rows)
+            logger.exception('sync_chunk_failed first=%s size=%s err=%s', rows[0]['id'], len(rows), exc)
+            return False
+    registry.inc('inclinic_sync_rows_total', value=len(rows))
+    stats.transferred += len(rows)
+    stats.watermark = max(stats.watermark or (rows[-1]['created_at'], rows[-1]['id']), (rows[-1]['created_at'], rows[-1]['id']))
+    return True
+
+
+def run_sync(chunk_size=500, time_budget=None, queryset=None, on_chunk=None):
+    stats = SyncStats()
+    started = time.monotonic()
+    for rows in iter_event_chunks(chunk_size, queryset):
+        _move(rows, stats)
+        stats.batches += 1
+        if on_chunk and on_chunk(stats) is False:
+            break
+        if time_budget and time.monotonic() - started >= time_budget:
+            break
+    stats.elapsed = time.monotonic() - started
+    stats.remaining, stats.lag_seconds = backlog(queryset)
+    record_run(stats)
+    return stats
+
+
+def partition_queryset(index, count):
+    # Equal slices of the uuid4 id space; ids are random, so slices get near-equal shares of every campaign.
+    step = (1 << 128) // count
+    events = Event.objects.filter(id__gte=uuid.UUID(int=index * step))
+    return events if index == count - 1 else events.filter(id__lt=uuid.UUID(int=(index + 1) * step))
+
+
+def sync_worker(index, count, chunk_size=500, time_budget=None, on_chunk=None):
+    stats = SyncStats()
+    started = time.monotonic()
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    chunks = None if skip_locked else iter_event_chunks(chunk_size, partition_queryset(index, count))
+    failed_ids = set()
+    while True:
+        if skip_locked:
+            # Claimed rows stay locked until the chunk is in reporting and deleted, so other workers skip past them.
+            # Rows of a chunk that failed for good stay in Event; this run leaves them for the next one instead of reclaiming them forever.
+            with transaction.atomic():
+                claim = Event.objects.select_for_update(skip_locked=True).exclude(id__in=failed_ids).order_by('created_at', 'id')
+                rows = list(claim.values(*SYNC_FIELDS)[:chunk_size])
+                if rows and not _move(rows, stats):
+                    failed_ids.update(row['id'] for row in rows)
+        else:
+            rows = next(chunks, None)
+            if rows:
+                _move(rows, stats)
+        if not rows:
+            break
+        stats.batches += 1
+        stats.elapsed = time.monotonic() - started
+        if on_chunk:
+            on_chunk(stats)
+        if time_budget and stats.elapsed >= time_budget:
+            break
+    stats.elapsed = time.monotonic() - started
+    return stats
+
+
+def merge_stats(results):
+    merged = SyncStats()
+    for stats in results:
+        merged.transferred += stats.transferred
+        merged.failed += stats.failed
+        merged.batches += stats.batches
+        if stats.watermark and (merged.watermark is None or stats.watermark > merged.watermark):
+            merged.watermark = stats.watermark
+    return merged
+
+
+def run_parallel_sync(workers, chunk_size=500, time_budget=None, on_chunk=None):
+    from .sync_workers import worker_main
+
+    context = multiprocessing.get_context('spawn')
+    updates = context.Queue()
+    connections.close_all()
+    started = time.monotonic()
+    processes = [context.Process(target=worker_main, args=(index, workers, chunk_size, time_budget, updates), daemon=True) for index in range(workers)]
+    for process in processes:
+        process.start()
+    latest, finished = {}, set()
+    while len(finished) < workers:
+        try:
+            kind, index, stats = updates.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+            continue
+        latest[index] = stats
+        if kind == 'done':
+            finished.add(index)
+        if on_chunk:
+            progress = merge_stats(latest.values())
+            progress.elapsed = time.monotonic() - started
+            on_chunk(progress)
+    for process in processes:
+        process.join()
+    for index in set(range(workers)) - finished:
+        logger.error('sync_worker_died index=%s exitcode=%s', index, processes[index].exitcode)
+    stats = merge_stats(latest.values())
+    for result in latest.values():
+        registry.inc('inclinic_sync_rows_total', value=result.transferred)
+    stats.elapsed = time.monotonic() - started
+    stats.remaining, stats.lag_seconds = backlog()
+    record_run(stats)
+    return stats
+
+
+def record_run(stats):
+    defaults = {
+        'last_run_at': timezone.now(),
+        'last_transferred': stats.transferred,
+        'last_failed': stats.failed,
+        'last_rows_per_second': stats.rows_per_second,
+        'last_remaining': stats.remaining,
+        'last_lag_seconds': stats.lag_seconds,
+    }
+    if stats.watermark:
+        defaults['watermark_at'], defaults['watermark_id'] = stats.watermark
+    SyncState.objects.using('reporting').update_or_create(pk=1, defaults=defaults)
+
+
+def _states():
+    return SyncState.objects.using('reporting')
+
+
+def acquire_lock(owner, status='running'):
+    # One runner at a time per reporting DB; an expired lease means its holder died and may be taken over.
+    now = timezone.now()
+    _states().get_or_create(pk=1)
+    free = Q(lock_owner='') | Q(lock_expires_at__lt=now) | Q(lock_owner=owner)
+    return _states().filter(free, pk=1).update(
+        lock_owner=owner, lock_expires_at=now + timedelta(seconds=settings.SYNC_LOCK_TTL), status=status,
+        started_at=now, rows_total=0, rows_moved=0, last_error='',
+    ) == 1
+
+
+def renew_lock(owner, **progress):
+    expires = timezone.now() + timedelta(seconds=settings.SYNC_LOCK_TTL)
+    return _states().filter(pk=1, lock_owner=owner).update(lock_expires_at=expires, **progress) == 1
+
+
+def release_lock(owner, error=''):
+    _states().filter(pk=1, lock_owner=owner).update(lock_owner='', lock_expires_at=None, status='failed' if error else 'idle', last_error=error)
+
+
+def run_locked_sync(owner, chunk_size=500, time_budget=None, workers=1):
+    remaining, _ = backlog()
+    if not renew_lock(owner, status='running', started_at=timezone.now(), rows_total=remaining):
+        return None
+    try:
+        heartbeat = lambda stats: renew_lock(owner, rows_moved=stats.transferred)
+        if workers > 1:
+            stats = run_parallel_sync(workers, chunk_size, time_budget, on_chunk=heartbeat)
+        else:
+            stats = run_sync(chunk_size, time_budget, on_chunk=heartbeat)
+    except Exception as exc:
+        logger.exception('sync_run_failed owner=%s', owner)
+        release_lock(owner, error=str(exc) or exc.__class__.__name__)
+        raise
+    release_lock(owner)
+    return stats
+
+
+def sync_status():
+    state = _states().filter(pk=1).first() or SyncState()
+    status = state.status
+    if state.lock_owner and state.lock_expires_at and state.lock_expires_at < timezone.now():
+        status = 'stalled'
+    eta = None
+    if status == 'running' and state.started_at and state.rows_moved:
+        rate = state.rows_moved / max((timezone.now() - state.started_at).total_seconds(), 0.001)
+        eta = round(max(state.rows_total - state.rows_moved, 0) / rate, 1)
+    return {
+        'status': status, 'rows_moved': state.rows_moved, 'rows_total': state.rows_total, 'eta_seconds': eta,
+        'started_at': state.started_at, 'last_run_at': state.last_run_at, 'last_transferred': state.last_transferred,
+        'remaining': state.last_remaining, 'last_error': state.last_error,
+    }
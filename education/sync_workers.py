@@ -0,0 +1,13 @@
+# Entry point for spawned sync workers; models may only be imported after django.setup() runs in the child.
+
+
+def worker_main(index, count, chunk_size, time_budget, updates):
+    from dataclasses import replace
+
+    import django
+
+    django.setup()
+    from .sync import sync_worker
+
+    stats = sync_worker(index, count, chunk_size, time_budget, on_chunk=lambda stats: updates.put(('chunk', index, replace(stats))))
+    updates.put(('done', index, stats))
@@ -1,12 +1,50 @@
+import gzip
+import json
+import re
 from datetime import timedelta
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
 from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
 from django.core.management import call_command
-from django.test import TestCase
-from django.urls import reverse
+from unittest import mock, skipUnless
+from PIL import Image
+from pypdf import PdfWriter
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections
+from django.db.models import QuerySet
+from asgiref.sync import iscoroutinefunction
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, override_settings
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, resolve, reverse
 from django.utils import timezone
-from .models import Campaign, CampaignSystem, Collateral, Doctor, Event, FieldRep, ReportingEvent, ShareInstance, UserProfile
-from .services import create_share, doctor_status
-from .views import _to_vimeo_embed_url
+from .models import Campaign, CampaignSystem, Collateral, Doctor, EngagementRollup, Event, FieldRep, ReplicaHeartbeat, ReportingEvent, ShareInstance, SyncState, UserProfile
+from . import async_views, replicas, urls
+from .access import access_for
+from .archive import Segment, funnel_summary, recover_pending, report_funnel, segment_paths, write_segment
+from .benchmarks import render_landing
+from .checks import check_shared_caches
+from .dashboards import DASHBOARD_PAGE_SIZE, dashboard_page
+from .db_router import EducationRouter
+from .exports import filtered_events, stream_events
+from .fragments import bump_fragment_version, fragment_version
+from .importers import import_field_reps, read_field_rep_csv
+from .ingest import EventBuffer, _encode, replay_spool
+from .jobs import submit
+from .media import serve_media
+from .metrics import Registry
+from .pagination import keyset_page
+from .replicas import STICKY_COOKIE, beat, replica_lag, routing
+from .resolver import ShareResolver, resolver
+from .rollups import campaign_summary, report_summary, summarize_events
+from .services import create_share, create_shares, doctor_status, doctor_statuses, ensure_link_clicked, mark_engagement, record_video_progress
+from .sync import acquire_lock, backlog, iter_event_chunks, merge_stats, partition_queryset, release_lock, run_locked_sync, run_sync, sync_status, sync_worker
+from .views import _collateral_context, _to_vimeo_embed_url
+
+SHARED_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': str(Path(tempfile.gettempdir()) / 'inclinic-test-cache')}}
 
 
 class BaseSetup(TestCase):
@@ -16,11 +54,12 @@ class BaseSetup(TestCase):
         self.publisher = User.objects.create_user('pub', password='x')
         UserProfile.objects.create(user=self.publisher, role='publisher')
         self.brand = User.objects.create_user('bm', password='x')
-        UserProfile.objects.create(user=self.brand, role='brand_manager')
+        self.brand_profile = UserProfile.objects.create(user=self.brand, role='brand_manager')
         self.campaign = Campaign.objects.create(
             company_name='C', brand_name='B', expected_doctors=10,
             contact_name='A', contact_phone='123', contact_email='a@a.com', created_by=self.publisher,
         )
+        self.brand_profile.campaigns.add(self.campaign)
         self.system = CampaignSystem.objects.create(campaign=self.campaign, system='inclinic')
         self.rep = FieldRep.objects.create(campaign=self.campaign, brand_rep_id='REP1', name='Rep', email='rep@x.com', phone='9999999999')
         self.col = Collateral.objects.create(campaign=self.campaign, system=self.system, classification='doctor_long', content_title='T', item_type='video', vimeo_url='https://vimeo.com/123')
@@ -68,11 +107,28 @@ class FlowTests(BaseSetup):
         share.save(update_fields=['created_at'])
         self.assertEqual(doctor_status(self.rep, self.doc), 'Send Reminder')
 
+    def test_bulk_statuses_use_constant_queries(self):
+        doctors = [Doctor.objects.create(campaign=self.campaign, field_rep=self.rep, name=f'D{i}', whatsapp_number=f'70000000{i:02d}') for i in range(4)]
+        read, _ = create_share(self.campaign, self.rep, doctors[0], self.col)
+        ensure_link_clicked(read)
+        old, _ = create_share(self.campaign, self.rep, doctors[1], self.col)
+        ShareInstance.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=7))
+        create_share(self.campaign, self.rep, doctors[2], self.col)
+        with self.assertNumQueries(1):
+            rows = dict(doctor_statuses(self.rep, self.rep.doctors.filter(pk__in=[d.pk for d in doctors])))
+        self.assertEqual([rows[d] for d in doctors], ['Read', 'Send Reminder', 'Sent', 'Send Message'])
+        self.assertEqual([doctor_status(self.rep, d) for d in doctors], ['Read', 'Send Reminder', 'Sent', 'Send Message'])
+
     def test_link_clicked_once(self):
         share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
         self.client.post(reverse('short_link', args=[share.short_code]), {'phone': self.doc.whatsapp_number})
         self.assertTrue(Event.objects.filter(share_instance=share, event_type='link_clicked').exists())
         self.assertTrue(Event.objects.filter(share_instance=share, event_type='landing_access').exists())
+        self.client.get(reverse('short_link', args=[share.short_code]))
+        self.assertEqual(Event.objects.filter(share_instance=share, event_type='link_clicked').count(), 1)
+        share.refresh_from_db()
+        self.assertIsNotNone(share.first_clicked_at)
+        self.assertIsNotNone(share.landing_verified_at)
 
     def test_sync_reporting(self):
         share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
@@ -88,11 +144,13 @@ class FlowTests(BaseSetup):
             collateral_id=self.col.id, field_rep_id=self.rep.id, doctor_id=self.doc.id, share_instance_id=1,
             created_at=timezone.now(),
         )
+        call_command('rebuild_rollups')
         self.client.login(username='bm', password='x')
         resp = self.client.get(reverse('brand_reports', args=[self.campaign.id]))
         self.assertContains(resp, 'Clicked')
         self.assertContains(resp, '<h4>1</h4>')
 
+    @override_settings(SYNC_JOB_EXECUTOR='inline')
     def test_brand_report_sync_now_moves_transaction_events(self):
         share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
         Event.objects.create(event_type='pdf_downloaded', campaign=self.campaign, collateral=self.col, field_rep=self.rep, doctor=self.doc, share_instance=share)
@@ -101,3 +159,991 @@ class FlowTests(BaseSetup):
         self.assertEqual(resp.status_code, 302)
         self.assertEqual(Event.objects.count(), 0)
         self.assertGreater(ReportingEvent.objects.using('reporting').count(), 0)
+
+
+class SyncEngineTests(BaseSetup):
+    def _events(self, count):
+        share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        for _ in range(count - 1):
+            Event.objects.create(event_type='video_progress', campaign=self.campaign, collateral=self.col, field_rep=self.rep, doctor=self.doc, share_instance=share, video_percentage=50)
+
+    def test_drains_backlog_in_chunks(self):
+        self._events(12)
+        stats = run_sync(chunk_size=5)
+        self.assertEqual(stats.transferred, 12)
+        self.assertEqual(stats.batches, 3)
+        self.assertEqual(stats.remaining, 0)
+        self.assertEqual(Event.objects.count(), 0)
+        self.assertEqual(ReportingEvent.objects.using('reporting').count(), 12)
+        state = SyncState.objects.using('reporting').get(pk=1)
+        self.assertEqual(state.last_transferred, 12)
+        self.assertIsNotNone(state.watermark_id)
+
+    def test_already_reported_rows_are_not_duplicated(self):
+        self._events(3)
+        event = Event.objects.order_by('created_at', 'id').first()
+        ReportingEvent.objects.using('reporting').create(
+            id=event.id, event_type=event.event_type, campaign_id=event.campaign_id, collateral_id=event.collateral_id,
+            field_rep_id=event.field_rep_id, doctor_id=event.doctor_id, share_instance_id=event.share_instance_id, created_at=event.created_at,
+        )
+        stats = run_sync(chunk_size=2)
+        self.assertEqual(stats.failed, 0)
+        self.assertEqual(ReportingEvent.objects.using('reporting').count(), 3)
+
+    def test_partitioned_workers_drain_disjoint_slices(self):
+        self._events(20)
+        slices = [set(partition_queryset(index, 3).values_list('id', flat=True)) for index in range(3)]
+        self.assertEqual(sum(len(ids) for ids in slices), 20)
+        self.assertEqual(set.union(*slices), set(Event.objects.values_list('id', flat=True)))
+        merged = merge_stats([sync_worker(index, 3, chunk_size=4) for index in range(3)])
+        self.assertEqual((merged.transferred, merged.failed, Event.objects.count()), (20, 0, 0))
+        self.assertEqual(campaign_summary(self.campaign.id)['total'], 20)
+
+    def test_skip_locked_worker_does_not_reclaim_failed_chunks(self):
+        self._events(5)
+        first = Event.objects.order_by('created_at', 'id').first()
+
+        def transfer(rows):
+            if rows[0]['id'] == first.id:
+                raise ValueError('bad row')
+            Event.objects.filter(id__in=[row['id'] for row in rows]).delete()
+
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', True), \
+                mock.patch('education.sync.transfer_chunk', side_effect=transfer), self.assertLogs('education.sync', 'ERROR'):
+            stats = sync_worker(0, 1, chunk_size=2)
+        self.assertEqual((stats.transferred, stats.failed, stats.batches), (3, 2, 3))
+        self.assertEqual(Event.objects.count(), 2)
+
+    def test_skip_locked_retry_rolls_back_failed_delete_to_savepoint(self):
+        self._events(3)
+        delete = QuerySet.delete
+        seen = []
+
+        def flaky(queryset):
+            if queryset.model is not Event:
+                return delete(queryset)
+            seen.append(queryset.count())
+            result = delete(queryset)
+            if len(seen) == 1:
+                raise OperationalError('database is locked')
+            return result
+
+        with mock.patch.object(connection.features, 'has_select_for_update_skip_locked', True), \
+                mock.patch.object(QuerySet, 'delete', flaky), mock.patch('education.sync.time.sleep'):
+            stats = sync_worker(0, 1, chunk_size=3)
+        self.assertEqual(seen, [3, 3])
+        self.assertEqual((stats.transferred, stats.failed, Event.objects.count()), (3, 0, 0))
+        self.assertEqual(ReportingEvent.objects.using('reporting').count(), 3)
+
+    def test_time_budget_stops_after_first_chunk(self):
+        self._events(6)
+        stats = run_sync(chunk_size=2, time_budget=1e-9)
+        self.assertEqual(stats.transferred, 2)
+        self.assertEqual(stats.remaining, 4)
+        self.assertGreaterEqual(stats.lag_seconds, 0)
+
+
+@override_settings(SYNC_JOB_EXECUTOR='inline')
+class SyncJobTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        Event.objects.create(event_type='link_clicked', campaign=self.campaign, collateral=self.col, field_rep=self.rep, doctor=self.doc, share_instance=share)
+        self.client.login(username='bm', password='x')
+
+    def test_lock_admits_one_runner_until_released_or_expired(self):
+        self.assertTrue(acquire_lock('a'))
+        self.assertFalse(acquire_lock('b'))
+        SyncState.objects.using('reporting').filter(pk=1).update(lock_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(sync_status()['status'], 'stalled')
+        self.assertTrue(acquire_lock('b'))
+        release_lock('b')
+        self.assertTrue(acquire_lock('a'))
+
+    def test_sync_now_skips_while_locked_and_reports_status(self):
+        acquire_lock('cron')
+        self.client.post(reverse('brand_reports', args=[self.campaign.id]), {'action': 'sync_now'})
+        self.assertEqual(Event.objects.count(), 2)
+        out = StringIO()
+        call_command('sync_reporting', stdout=out)
+        self.assertIn('sync skipped', out.getvalue())
+        release_lock('cron')
+        self.client.post(reverse('brand_reports', args=[self.campaign.id]), {'action': 'sync_now'})
+        status = self.client.get(reverse('reporting_sync_status')).json()
+        self.assertEqual((status['status'], status['rows_moved'], status['rows_total'], Event.objects.count()), ('idle', 2, 2, 0))
+
+    def test_failed_run_releases_lock_with_error(self):
+        acquire_lock('job')
+        with mock.patch('education.sync.run_sync', side_effect=RuntimeError('reporting down')), self.assertLogs('education', 'ERROR'):
+            submit(run_locked_sync, 'job')
+        status = sync_status()
+        self.assertEqual((status['status'], status['last_error']), ('failed', 'reporting down'))
+        self.assertTrue(acquire_lock('next'))
+
+
+class RollupTests(BaseSetup):
+    def _track(self, share, kind, percentage=None, doctor=None):
+        Event.objects.create(event_type=kind, campaign=self.campaign, collateral=self.col, field_rep=self.rep, doctor=doctor or self.doc, share_instance=share, video_percentage=percentage)
+
+    def test_sync_maintains_rollups_incrementally(self):
+        share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        other = Doctor.objects.create(campaign=self.campaign, field_rep=self.rep, name='Doc2', whatsapp_number='7777777777')
+        self._track(share, 'link_clicked')
+        self._track(share, 'video_progress', 50)
+        run_sync(chunk_size=2)
+        self._track(share, 'video_progress', 100)
+        self._track(share, 'link_clicked', doctor=other)
+        run_sync()
+        summary = campaign_summary(self.campaign.id)
+        self.assertEqual(summary, {'unique_doctors': 2, 'clicked': 2, 'downloads': 0, 'last_page': 0, 'video_50': 1, 'video_100': 1, 'total': 5})
+        rollup = EngagementRollup.objects.using('reporting').get(campaign_id=self.campaign.id)
+        self.assertEqual((rollup.events, rollup.clicked, rollup.video_50), (5, 2, 2))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        self._track(share, 'pdf_downloaded')
+        self._track(share, 'pdf_last_page')
+        run_sync()
+        incremental = campaign_summary(self.campaign.id)
+        call_command('rebuild_rollups', batch_size=1)
+        self.assertEqual(campaign_summary(self.campaign.id), incremental)
+        self.assertEqual(incremental['downloads'], 1)
+
+
+class ReportSummaryTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        for kind, percentage in [('link_clicked', None), ('video_progress', 60), ('video_progress', 100), ('pdf_downloaded', None)]:
+            Event.objects.create(event_type=kind, campaign=self.campaign, collateral=self.col, field_rep=self.rep, doctor=self.doc, share_instance=share, video_percentage=percentage)
+        run_sync()
+
+    def test_raw_and_rollup_summaries_are_one_query_and_match(self):
+        events = ReportingEvent.objects.using('reporting').filter(campaign_id=self.campaign.id)
+        with self.assertNumQueries(1, using='reporting'):
+            raw = summarize_events(events)
+        with self.assertNumQueries(1, using='reporting'):
+            self.assertEqual(raw, campaign_summary(self.campaign.id))
+        self.assertEqual(raw['video_100'], 1)
+
+    def test_summary_cached_until_watermark_moves(self):
+        report_summary(self.campaign.id)
+        with self.assertNumQueries(1, using='reporting'):
+            self.assertEqual(report_summary(self.campaign.id)['total'], 5)
+        Event.objects.create(event_type='pdf_last_page', campaign=self.campaign, collateral=self.col, field_rep=self.rep, doctor=self.doc, share_instance=ShareInstance.objects.get())
+        run_sync()
+        self.assertEqual(report_summary(self.campaign.id)['last_page'], 1)
+
+    def test_rebuild_verify_reports_no_mismatch(self):
+        err = StringIO()
+        call_command('rebuild_rollups', verify=True, stdout=StringIO(), stderr=err)
+        self.assertEqual(err.getvalue(), '')
+
+
+class ArchiveTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        self.archive = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive.cleanup)
+        self.enterContext(override_settings(REPORTING_ARCHIVE_DIR=self.archive.name))
+        share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        other = Doctor.objects.create(campaign=self.campaign, field_rep=self.rep, name='Doc2', whatsapp_number='7777777777')
+        self.now = timezone.now()
+        old = self.now - timedelta(days=70)
+        for doctor, kind, percentage, created in [
+            (self.doc, 'link_clicked', None, old), (other, 'video_progress', 100, old), (other, 'pdf_downloaded', None, old + timedelta(days=1)),
+            (self.doc, 'video_progress', 50, self.now), (other, 'pdf_last_page', None, self.now),
+        ]:
+            Event.objects.create(event_type=kind, campaign=self.campaign, collateral=self.col, field_rep=self.rep, doctor=doctor, share_instance=share, video_percentage=percentage, created_at=created)
+        run_sync()
+        self.cutoff = self.now - timedelta(days=30)
+
+    def test_archive_moves_old_rows_and_keeps_funnel(self):
+        before = funnel_summary(self.campaign.id)
+        call_command('archive_reporting_events', before=self.cutoff.date().isoformat(), stdout=StringIO())
+        self.assertEqual(ReportingEvent.objects.using('reporting').count(), 3)
+        [path] = segment_paths(self.campaign.id)
+        with Segment(path) as segment:
+            self.assertEqual(segment.rows, 3)
+            self.assertEqual(sorted(segment.column('event_type')), ['link_clicked', 'pdf_downloaded', 'video_progress'])
+        self.assertEqual(funnel_summary(self.campaign.id), before)
+        self.assertEqual(before, campaign_summary(self.campaign.id))
+        recent = funnel_summary(self.campaign.id, start=self.cutoff)
+        self.assertEqual((recent['unique_doctors'], recent['video_50'], recent['downloads'], recent['total']), (2, 1, 0, 3))
+        first_day = funnel_summary(self.campaign.id, start=self.now - timedelta(days=71), end=self.now - timedelta(days=69, hours=12))
+        self.assertEqual((first_day['clicked'], first_day['video_100'], first_day['downloads'], first_day['total']), (1, 1, 0, 2))
+
+    def test_funnel_reads_hot_rows_in_one_query_and_caches_by_watermark(self):
+        with self.assertNumQueries(1, using='reporting'):
+            self.assertEqual(funnel_summary(self.campaign.id)['total'], 6)
+        call_command('archive_reporting_events', before=self.cutoff.date().isoformat(), stdout=StringIO())
+        with self.assertNumQueries(1, using='reporting'):
+            self.assertEqual(funnel_summary(self.campaign.id)['unique_doctors'], 2)
+        recent = report_funnel(self.campaign.id, start=self.cutoff)
+        with self.assertNumQueries(1, using='reporting'):
+            self.assertEqual(report_funnel(self.campaign.id, start=self.cutoff), recent)
+        Event.objects.create(event_type='link_clicked', campaign=self.campaign, collateral=self.col, field_rep=self.rep, doctor=self.doc, share_instance=ShareInstance.objects.get())
+        run_sync()
+        self.assertEqual(report_funnel(self.campaign.id, start=self.cutoff)['total'], recent['total'] + 1)
+
+    def test_rebuild_includes_archived_segments(self):
+        summary = campaign_summary(self.campaign.id)
+        call_command('archive_reporting_events', before=self.cutoff.date().isoformat(), stdout=StringIO())
+        err = StringIO()
+        call_command('rebuild_rollups', verify=True, stdout=StringIO(), stderr=err)
+        self.assertEqual(err.getvalue(), '')
+        self.assertEqual(campaign_summary(self.campaign.id), summary)
+
+    def test_recover_pending_depends_on_committed_delete(self):
+        rows = list(ReportingEvent.objects.using('reporting').values()[:2])
+        write_segment(self.campaign.id, '2020-01', rows)
+        self.assertEqual(recover_pending(), (0, 1))
+        write_segment(self.campaign.id, '2020-01', rows)
+        ReportingEvent.objects.using('reporting').filter(id__in=[row['id'] for row in rows]).delete()
+        self.assertEqual(recover_pending(), (1, 0))
+        self.assertEqual(len(list(segment_paths(self.campaign.id))), 1)
+
+
+class ExportTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        for kind in ('link_clicked', 'pdf_downloaded'):
+            Event.objects.create(event_type=kind, campaign=self.campaign, collateral=self.col, field_rep=self.rep, doctor=self.doc, share_instance=share)
+        run_sync()
+        self.client.login(username='bm', password='x')
+
+    def test_export_streams_csv_with_filters(self):
+        url = reverse('brand_reports_export', args=[self.campaign.id])
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['id', 'event_type'])
+        self.assertEqual(len(lines), 4)
+        response = self.client.get(url, {'rep': self.rep.id + 1})
+        self.assertEqual(len(b''.join(response.streaming_content).decode().splitlines()), 1)
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+
+    async def test_export_streams_asynchronously_under_asgi(self):
+        await self.async_client.aforce_login(self.brand)
+        response = await self.async_client.get(reverse('brand_reports_export', args=[self.campaign.id]))
+        self.assertTrue(response.is_async)
+        self.assertEqual(len(b''.join([chunk async for chunk in response.streaming_content]).decode().splitlines()), 4)
+
+    def test_hot_rows_are_read_in_keyset_pages(self):
+        with CaptureQueriesContext(connections['reporting']) as ctx:
+            lines = b''.join(stream_events(filtered_events(self.campaign.id), chunk_size=2)).decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(len(ctx.captured_queries), 3)
+        self.assertTrue(all('LIMIT 2' in query['sql'] for query in ctx.captured_queries))
+
+    def test_export_gzip_ndjson_includes_archive(self):
+        with tempfile.TemporaryDirectory() as archive, override_settings(REPORTING_ARCHIVE_DIR=archive):
+            call_command('archive_reporting_events', before=(timezone.now() + timedelta(days=1)).date().isoformat(), stdout=StringIO())
+            response = self.client.get(reverse('brand_reports_export', args=[self.campaign.id]), {'format': 'ndjson', 'gzip': '1', 'archived': '1'})
+            body = gzip.decompress(b''.join(response.streaming_content))
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(sorted(row['event_type'] for row in rows), ['link_clicked', 'pdf_downloaded', 'share_initiated'])
+
+    def test_export_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'events.csv'
+            call_command('export_reporting_events', str(self.campaign.id), output=str(path), collateral=self.col.id)
+            self.assertEqual(len(path.read_text().splitlines()), 4)
+
+
+class EventBrowserTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        start = timezone.now() - timedelta(hours=1)
+        ReportingEvent.objects.using('reporting').bulk_create([
+            ReportingEvent(
+                id=f'00000000-0000-0000-0000-{i:012d}', event_type='pdf_downloaded' if i % 2 else 'link_clicked', campaign_id=self.campaign.id,
+                collateral_id=self.col.id, field_rep_id=self.rep.id, doctor_id=self.doc.id, share_instance_id=1, created_at=start + timedelta(minutes=i // 2),
+            )
+            for i in range(7)
+        ])
+        self.events = ReportingEvent.objects.using('reporting').filter(campaign_id=self.campaign.id)
+
+    def test_pages_walk_newest_first_and_back(self):
+        first = keyset_page(self.events, page_size=3)
+        second = keyset_page(self.events, first.next_cursor, page_size=3)
+        third = keyset_page(self.events, second.next_cursor, page_size=3)
+        ordered = [str(event.id) for event in self.events.order_by('-created_at', '-id')]
+        self.assertEqual([str(event.id) for page in (first, second, third) for event in page.rows], ordered)
+        self.assertEqual((first.prev_cursor, third.next_cursor), (None, None))
+        self.assertEqual(keyset_page(self.events, second.prev_cursor, page_size=3).rows, first.rows)
+        self.assertEqual(keyset_page(self.events, 'tampered', page_size=3).rows, first.rows)
+
+    def test_brand_report_filters_events(self):
+        self.client.login(username='bm', password='x')
+        resp = self.client.get(reverse('brand_reports', args=[self.campaign.id]), {'type': 'pdf_downloaded', 'rep': self.rep.id})
+        self.assertEqual([event.event_type for event in resp.context['page'].rows], ['pdf_downloaded'] * 3)
+        self.assertEqual(resp.context['query'], f'type=pdf_downloaded&rep={self.rep.id}')
+
+
+class BufferedIngestTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        self.share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        self.spool = tempfile.TemporaryDirectory()
+        self.addCleanup(self.spool.cleanup)
+
+    def _event(self, kind='pdf_downloaded'):
+        return Event(event_type=kind, campaign_id=self.campaign.id, collateral_id=self.col.id, field_rep_id=self.rep.id, doctor_id=self.doc.id, share_instance_id=self.share.id)
+
+    def test_buffer_flushes_on_size_and_clears_spool(self):
+        buffer = EventBuffer(self.spool.name, max_size=2, max_age=0)
+        buffer.enqueue(self._event())
+        self.assertEqual(Event.objects.filter(event_type='pdf_downloaded').count(), 0)
+        self.assertEqual(len(list(Path(self.spool.name).iterdir())), 1)
+        buffer.enqueue(self._event())
+        self.assertEqual(Event.objects.filter(event_type='pdf_downloaded').count(), 2)
+        self.assertEqual(list(Path(self.spool.name).iterdir()), [])
+
+    def test_replay_recovers_unflushed_spool_once(self):
+        event = self._event()
+        EventBuffer(self.spool.name, max_size=10, max_age=0).enqueue(event)
+        call_command('replay_event_spool', spool_dir=self.spool.name, stdout=StringIO())
+        call_command('replay_event_spool', spool_dir=self.spool.name, stdout=StringIO())
+        replayed = Event.objects.get(event_type='pdf_downloaded')
+        self.assertEqual((replayed.id, replayed.created_at), (event.id, event.created_at))
+
+    def test_replay_quarantines_bad_rows_and_keeps_files_while_database_is_down(self):
+        orphan = self._event('pdf_last_page')
+        orphan.campaign_id = None
+        spool = Path(self.spool.name) / '1-a.ndjson'
+        spool.write_text(_encode(self._event()) + '\n' + _encode(orphan) + '\nnot json\n')
+        with mock.patch('education.ingest.insert_events', side_effect=OperationalError('down')), self.assertLogs('education.ingest', 'ERROR'):
+            self.assertEqual(replay_spool(self.spool.name), (0, 0, 0))
+        self.assertTrue(spool.exists())
+        with self.assertLogs('education.ingest', 'ERROR'):
+            self.assertEqual(replay_spool(self.spool.name), (1, 1, 2))
+        self.assertFalse(spool.exists())
+        self.assertEqual(Event.objects.filter(event_type='pdf_downloaded').count(), 1)
+        self.assertEqual(len((Path(self.spool.name) / 'quarantine' / spool.name).read_text().splitlines()), 2)
+
+    def test_failed_flush_is_retried_instead_of_dropped(self):
+        buffer = EventBuffer(self.spool.name, max_size=1, max_age=0)
+        with mock.patch('education.ingest.insert_events', side_effect=OperationalError('down')), self.assertLogs('education.ingest', 'ERROR'):
+            buffer.enqueue(self._event())
+        self.assertEqual(Event.objects.filter(event_type='pdf_downloaded').count(), 0)
+        self.assertEqual(len(list(Path(self.spool.name).iterdir())), 1)
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(Event.objects.filter(event_type='pdf_downloaded').count(), 1)
+        self.assertEqual(list(Path(self.spool.name).iterdir()), [])
+
+    def test_track_event_enqueues_valid_payloads_only(self):
+        with override_settings(EVENT_INGEST_MODE='buffered', EVENT_SPOOL_DIR=self.spool.name, EVENT_BUFFER_MAX_SIZE=1, EVENT_BUFFER_MAX_AGE=0):
+            ok = self.client.get(reverse('track_event', args=[self.share.short_code]), {'type': 'video_progress', 'percentage': '50'})
+            bad = self.client.get(reverse('track_event', args=[self.share.short_code]), {'type': 'video_progress', 'percentage': 'abc'})
+        self.assertEqual(ok.json(), {'status': 'queued'})
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual(Event.objects.get(event_type='video_progress').video_percentage, 50)
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class ShareResolverTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        resolver.clear()
+        self.share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+
+    def test_resolves_related_objects_once(self):
+        with self.assertNumQueries(1):
+            share = resolver.resolve(self.share.short_code)
+            self.assertEqual((share.collateral.content_title, share.doctor.name, share.field_rep.name), ('T', 'Doc', 'Rep'))
+        hits = resolver.stats().get('local_hits', 0)
+        with self.assertNumQueries(0):
+            resolver.resolve(self.share.short_code)
+        self.assertEqual(resolver.stats()['local_hits'], hits + 1)
+
+    def test_saves_and_deletes_invalidate_only_affected_codes(self):
+        other_col = Collateral.objects.create(campaign=self.campaign, system=self.system, classification='doctor_long', content_title='Other', item_type='pdf')
+        other, _ = create_share(self.campaign, self.rep, self.doc, other_col)
+        resolver.resolve(self.share.short_code)
+        resolver.resolve(other.short_code)
+        self.col.content_title = 'Updated'
+        self.col.save()
+        self.assertEqual(resolver.resolve(self.share.short_code).collateral.content_title, 'Updated')
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.resolve(other.short_code).collateral.content_title, 'Other')
+        # Another worker's local copy expires and it then sees the shared entry dropped by the delete.
+        worker = ShareResolver(local_ttl=0)
+        worker.resolve(other.short_code)
+        other_col.delete()
+        self.assertIsNone(worker.resolve(other.short_code))
+        self.doc.name = 'Renamed'
+        self.doc.save()
+        self.assertEqual(worker.resolve(self.share.short_code).doctor.name, 'Renamed')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_per_process_cache_always_reads_the_row(self):
+        resolver.resolve(self.share.short_code)
+        ShareInstance.objects.filter(pk=self.share.pk).delete()
+        self.assertIsNone(resolver.resolve(self.share.short_code))
+
+    def test_lru_is_bounded(self):
+        local = ShareResolver(maxsize=1)
+        other, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        local.resolve(self.share.short_code)
+        local.resolve(other.short_code)
+        self.assertEqual(local.stats()['size'], 1)
+        self.assertEqual(local.stats()['evictions'], 1)
+        self.assertIsNone(local.resolve('missing'))
+
+    def test_unknown_code_is_404(self):
+        self.assertEqual(self.client.get(reverse('short_link', args=['missing'])).status_code, 404)
+
+
+class FieldRepImportTests(BaseSetup):
+    CSV = (
+        'brand-supplied-field-rep-id,field-rep-name,email-id,phone-number\n'
+        'REP1,Rep Renamed,rep@x.com,9999999999\n'
+        'REP2,New Rep,new@x.com,9000000000\n'
+        'REP3,Bad Email,not-an-email,9000000001\n'
+        'REP2,Twice,twice@x.com,9000000002\n'
+    )
+
+    def test_upload_inserts_updates_and_reports_errors(self):
+        self.client.login(username='pub', password='x')
+        upload = SimpleUploadedFile('reps.csv', self.CSV.encode())
+        resp = self.client.post(reverse('upload_field_reps', args=[self.campaign.id]), {'csv_file': upload}, follow=True)
+        self.assertContains(resp, '1 added, 1 updated, 0 unchanged, 2 rejected')
+        self.assertContains(resp, 'Line 4: email is invalid')
+        self.assertEqual(FieldRep.objects.get(brand_rep_id='REP1').name, 'Rep Renamed')
+        self.assertEqual(FieldRep.objects.get(brand_rep_id='REP2').name, 'New Rep')
+
+    def test_invalid_headers_are_form_errors(self):
+        self.client.login(username='pub', password='x')
+        upload = SimpleUploadedFile('reps.csv', b'id,name\n1,x\n')
+        resp = self.client.post(reverse('upload_field_reps', args=[self.campaign.id]), {'csv_file': upload})
+        self.assertContains(resp, 'CSV headers are invalid')
+
+    def test_undecodable_file_is_a_form_error_and_imports_nothing(self):
+        self.client.login(username='pub', password='x')
+        rows = ''.join(f'R{i},Rep {i},r{i}@x.com,9{i:09d}\n' for i in range(400))
+        content = ('brand-supplied-field-rep-id,field-rep-name,email-id,phone-number\n' + rows).encode() + b'R400,Caf\xe9,cafe@x.com,9000000400\n'
+        resp = self.client.post(reverse('upload_field_reps', args=[self.campaign.id]), {'csv_file': SimpleUploadedFile('reps.csv', content)})
+        self.assertContains(resp, 'CSV file is not UTF-8 text; nothing was imported')
+        self.assertEqual(FieldRep.objects.filter(campaign=self.campaign).count(), 1)
+        with self.assertRaises(ValidationError):
+            import_field_reps(self.campaign, read_field_rep_csv(SimpleUploadedFile('reps.csv', content)), chunk_size=100)
+        self.assertEqual(FieldRep.objects.filter(campaign=self.campaign).count(), 1)
+
+    def test_chunks_query_existing_reps_once(self):
+        rows = ''.join(f'R{i},Rep {i},r{i}@x.com,90000000{i:02d}\n' for i in range(6))
+        upload = SimpleUploadedFile('reps.csv', ('brand-supplied-field-rep-id,field-rep-name,email-id,phone-number\n' + rows).encode())
+        content = upload.read()
+        upload.seek(0)
+        with self.assertNumQueries(3 * 2 + 2):
+            result = import_field_reps(self.campaign, read_field_rep_csv(upload), chunk_size=2)
+        self.assertEqual((result.inserted, result.updated, result.skipped), (6, 0, 0))
+        result = import_field_reps(self.campaign, read_field_rep_csv(SimpleUploadedFile('reps.csv', content)))
+        self.assertEqual(result.skipped, 6)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are asserted against SQLite EXPLAIN QUERY PLAN output.')
+class QueryPlanTests(BaseSetup):
+    FULL_SCAN = re.compile(r'^SCAN (TABLE )?education_\w+$')
+
+    def setUp(self):
+        super().setUp()
+        self.share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        Event.objects.create(event_type='link_clicked', campaign=self.campaign, collateral=self.col, field_rep=self.rep, doctor=self.doc, share_instance=self.share)
+
+    def assertNoFullScan(self, action, using='default'):
+        with CaptureQueriesContext(connections[using]) as captured:
+            action()
+        selects = [query['sql'] for query in captured.captured_queries if query['sql'].lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE'))]
+        self.assertTrue(selects)
+        with connections[using].cursor() as cursor:
+            for sql in selects:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                plan = [row[-1] for row in cursor.fetchall()]
+                self.assertFalse([step for step in plan if self.FULL_SCAN.match(step)], f'{sql}\n' + '\n'.join(plan))
+
+    def test_share_and_status_lookups(self):
+        self.assertNoFullScan(lambda: ensure_link_clicked(self.share))
+        self.assertNoFullScan(lambda: doctor_statuses(self.rep, self.rep.doctors.all()))
+        self.assertNoFullScan(lambda: (resolver.clear(), resolver.resolve(self.share.short_code)))
+
+    def test_sync_ordering_and_backlog(self):
+        self.assertNoFullScan(lambda: list(iter_event_chunks(1)))
+        self.assertNoFullScan(backlog)
+        self.assertNoFullScan(run_sync, using='reporting')
+
+    def test_engagement_backfill_reads_reporting_by_share(self):
+        run_sync()
+        self.assertNoFullScan(lambda: call_command('backfill_share_engagement', stdout=StringIO()), using='reporting')
+
+    def test_report_summaries(self):
+        run_sync()
+        events = ReportingEvent.objects.using('reporting').filter(campaign_id=self.campaign.id)
+        self.assertNoFullScan(lambda: summarize_events(events), using='reporting')
+        self.assertNoFullScan(lambda: campaign_summary(self.campaign.id), using='reporting')
+
+    def test_event_browser_pages_use_indexes(self):
+        run_sync()
+        events = ReportingEvent.objects.using('reporting').filter(campaign_id=self.campaign.id)
+        for filtered in (events, events.filter(event_type='link_clicked'), events.filter(doctor_id=self.doc.id)):
+            page = keyset_page(filtered, page_size=1)
+            self.assertNoFullScan(lambda: keyset_page(filtered, page.next_cursor, page_size=1), using='reporting')
+            self.assertNoFullScan(lambda: keyset_page(filtered, page.prev_cursor or page.next_cursor, page_size=1), using='reporting')
+
+    def test_roster_import_lookup(self):
+        csv_file = SimpleUploadedFile('reps.csv', b'brand-supplied-field-rep-id,field-rep-name,email-id,phone-number\nREP1,Rep,rep@x.com,1\n')
+        self.assertNoFullScan(lambda: import_field_reps(self.campaign, read_field_rep_csv(csv_file)))
+
+
+class BenchmarkCommandTests(TestCase):
+    databases = {'default', 'reporting'}
+
+    def test_seed_is_deterministic_and_bench_writes_json(self):
+        call_command('seed_benchmark', campaigns=1, reps=4, doctors=3, collaterals=2, shares=20, stdout=StringIO())
+        codes = list(ShareInstance.objects.order_by('id').values_list('short_code', flat=True))
+        call_command('seed_benchmark', campaigns=1, reps=4, doctors=3, collaterals=2, shares=20, reset=True, stdout=StringIO())
+        self.assertEqual(list(ShareInstance.objects.order_by('id').values_list('short_code', flat=True)), codes)
+        with tempfile.TemporaryDirectory() as tmp:
+            output = Path(tmp) / 'bench.json'
+            call_command('bench', output=str(output), repeat=1, shares=2, csv_rows=5, stdout=StringIO())
+            results = json.loads(output.read_text())['results']
+        self.assertEqual(set(results), {
+            'doctor_status', 'create_share', 'landing_render_uncached', 'landing_render_cached', 'csv_import', 'sync_reporting',
+            'brand_reports_summary', 'brand_reports_raw_summary',
+        })
+        self.assertEqual(results['landing_render_cached']['result'], results['landing_render_uncached']['result'])
+        self.assertGreater(results['sync_reporting']['result']['transferred'], 0)
+        self.assertGreater(results['brand_reports_summary']['queries']['reporting'], 0)
+
+
+class AsyncDoctorURLConf:
+    urlpatterns = [path(f's/<str:code>/{suffix}', getattr(async_views, name), name=name) for suffix, name in (('', 'short_link'), ('landing/', 'doctor_landing'), ('track/', 'track_event'))] + urls.urlpatterns
+
+
+@override_settings(ASYNC_DOCTOR_VIEWS=True, ROOT_URLCONF=AsyncDoctorURLConf)
+class AsyncDoctorViewTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        self.share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        resolver.clear()
+
+    def test_doctor_urls_route_to_async_views(self):
+        for name in ('short_link', 'doctor_landing', 'track_event'):
+            self.assertTrue(iscoroutinefunction(resolve(reverse(name, args=[self.share.short_code])).func))
+
+    async def test_async_flow_records_engagement_once(self):
+        client = AsyncClient()
+        url = reverse('short_link', args=[self.share.short_code])
+        await client.get(url)
+        await client.get(url)
+        resp = await client.post(url, {'phone': '8888888888'})
+        self.assertEqual(resp.status_code, 302)
+        landing = await client.get(reverse('doctor_landing', args=[self.share.short_code]))
+        self.assertEqual(landing.status_code, 200)
+        resp = await client.get(reverse('track_event', args=[self.share.short_code]), {'type': 'video_progress', 'percentage': '50'})
+        self.assertEqual(resp.json(), {'status': 'ok'})
+        share = await ShareInstance.objects.aget(pk=self.share.pk)
+        self.assertIsNotNone(share.landing_verified_at)
+        self.assertEqual(share.max_video_percent, 50)
+        self.assertEqual(await Event.objects.filter(event_type='link_clicked').acount(), 1)
+
+    async def test_unknown_code_is_404(self):
+        resp = await AsyncClient().get(reverse('track_event', args=['missing']), {'type': 'pdf_downloaded'})
+        self.assertEqual(resp.status_code, 404)
+
+
+class MetricsTests(BaseSetup):
+    def test_histogram_rendering(self):
+        local = Registry()
+        local.observe('latency_seconds', 0.02, {'view': 'home'}, buckets=(0.01, 0.1))
+        local.observe('latency_seconds', 0.5, {'view': 'home'}, buckets=(0.01, 0.1))
+        text = local.render()
+        self.assertIn('# TYPE latency_seconds histogram', text)
+        self.assertIn('latency_seconds_bucket{view="home",le="0.01"} 0', text)
+        self.assertIn('latency_seconds_bucket{view="home",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{view="home",le="+Inf"} 2', text)
+        self.assertIn('latency_seconds_count{view="home"} 2', text)
+
+    @override_settings(METRICS_TOKEN='scrape-token')
+    def test_metrics_endpoint_reports_requests_events_and_sync(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        self.client.get(reverse('track_event', args=[share.short_code]), {'type': 'pdf_downloaded'})
+        run_sync()
+        resp = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(resp.status_code, 200)
+        text = resp.content.decode()
+        self.assertIn('inclinic_request_duration_seconds_bucket{view="track_event",le="+Inf"}', text)
+        self.assertRegex(text, r'inclinic_db_queries_total\{db="default",view="track_event"\} [1-9]')
+        self.assertRegex(text, r'inclinic_events_ingested_total\{type="pdf_downloaded"\} [1-9]')
+        self.assertIn('inclinic_sync_backlog_rows 0', text)
+
+
+class ShareEngagementTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        self.share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+
+    def test_video_percent_only_moves_up(self):
+        self.assertTrue(mark_engagement(self.share, 'video_progress', 50))
+        stale = ShareInstance.objects.get(pk=self.share.pk)
+        stale.max_video_percent = 0
+        self.assertFalse(mark_engagement(stale, 'video_progress', 25))
+        self.assertTrue(mark_engagement(stale, 'video_progress', 100))
+        self.share.refresh_from_db()
+        self.assertEqual(self.share.max_video_percent, 100)
+
+    def test_video_pings_emit_only_milestone_crossings(self):
+        url = reverse('track_event', args=[self.share.short_code])
+        statuses = [self.client.get(url, {'type': 'video_progress', 'percentage': p}).json()['status'] for p in (10, 30, 40, 55, 52, 99, 100, 100)]
+        self.assertEqual(statuses, ['coalesced', 'ok', 'coalesced', 'ok', 'coalesced', 'ok', 'ok', 'coalesced'])
+        self.assertEqual(list(Event.objects.filter(event_type='video_progress').order_by('video_percentage').values_list('video_percentage', flat=True)), [25, 50, 75, 100])
+        self.share.refresh_from_db()
+        self.assertEqual(self.share.max_video_percent, 100)
+        for params in ({'type': 'video_progress'}, {'type': 'video_progress', 'percentage': '150'}, {'type': 'video_progress', 'percentage': '-5'}, {'type': 'share_initiated'}, {'type': 'bogus'}):
+            self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_concurrent_pings_claim_a_milestone_once(self):
+        stale = ShareInstance.objects.get(pk=self.share.pk)
+        self.assertEqual(record_video_progress(self.share, 60), 50)
+        self.assertIsNone(record_video_progress(stale, 55))
+        self.assertEqual(record_video_progress(stale, 80), 75)
+        self.assertIsNone(record_video_progress(stale, 70))
+
+    def test_click_dedup_is_a_single_conditional_update(self):
+        stale = ShareInstance.objects.get(pk=self.share.pk)
+        ensure_link_clicked(self.share)
+        with self.assertNumQueries(1):
+            ensure_link_clicked(stale)
+        with self.assertNumQueries(0):
+            ensure_link_clicked(self.share)
+        self.assertEqual(Event.objects.filter(event_type='link_clicked').count(), 1)
+        self.assertEqual(doctor_status(self.rep, self.doc), 'Read')
+
+    def test_backfill_reads_both_databases(self):
+        Event.objects.create(event_type='pdf_downloaded', campaign=self.campaign, collateral=self.col, field_rep=self.rep, doctor=self.doc, share_instance=self.share)
+        ReportingEvent.objects.using('reporting').create(
+            id='22222222-2222-2222-2222-222222222222', event_type='video_progress', campaign_id=self.campaign.id, collateral_id=self.col.id,
+            field_rep_id=self.rep.id, doctor_id=self.doc.id, share_instance_id=self.share.id, video_percentage=100, created_at=timezone.now(),
+        )
+        call_command('backfill_share_engagement', stdout=StringIO())
+        self.share.refresh_from_db()
+        self.assertIsNotNone(self.share.downloaded_at)
+        self.assertEqual(self.share.max_video_percent, 100)
+
+
+@override_settings(REPLICA_DATABASES=['replica_1'], REPLICA_MAX_LAG_SECONDS=5)
+class ReplicaRoutingTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        replicas._lag.clear()
+        self.router = EducationRouter()
+
+    def test_replica_reads_are_opt_in_and_end_at_the_first_write(self):
+        with mock.patch('education.replicas.replica_lag', return_value=0.5):
+            self.assertEqual(self.router.db_for_read(Campaign), 'default')
+            with routing(allowed=True):
+                self.assertEqual(self.router.db_for_read(Campaign), 'replica_1')
+                self.assertEqual(self.router.db_for_read(ReportingEvent), 'reporting')
+                self.assertEqual(self.router.db_for_write(Campaign), 'default')
+                self.assertEqual(self.router.db_for_read(Campaign), 'default')
+        self.assertFalse(self.router.allow_migrate('replica_1', 'education', 'campaign'))
+
+    def test_lagging_or_unreachable_replica_falls_back_to_primary(self):
+        with mock.patch('education.replicas.replica_lag', return_value=30.0), routing(allowed=True):
+            self.assertEqual(self.router.db_for_read(Campaign), 'default')
+        replicas._lag.clear()
+        # The reporting SQLite file stands in for a replica that is missing the heartbeat table.
+        ReplicaHeartbeat.objects.create(pk=1, beat_at=timezone.now())
+        with override_settings(REPLICA_DATABASES=['reporting']), routing(allowed=True), self.assertLogs('education.replicas', 'WARNING'):
+            self.assertEqual(self.router.db_for_read(Campaign), 'default')
+
+    def test_heartbeat_lag_against_a_mirror_is_zero(self):
+        beat()
+        self.assertEqual(replica_lag('default'), 0.0)
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        self.client.login(username='bm', password='x')
+        url = reverse('brand_field_reps', args=[self.campaign.id])
+        with mock.patch('education.replicas.replica_lag', return_value=30.0) as lag:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(lag.call_count, 1)
+            self.assertNotIn(STICKY_COOKIE, resp.cookies)
+            resp = self.client.post(reverse('login'), {'username': 'bm', 'password': 'x'})
+            self.assertIn(STICKY_COOKIE, resp.cookies)
+            replicas._lag.clear()
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(lag.call_count, 1)
+
+
+class DashboardTests(BaseSetup):
+    def test_campaign_rows_are_annotated_in_one_query_and_cached(self):
+        Collateral.objects.create(campaign=self.campaign, system=self.system, classification='doctor_long', content_title='Old', item_type='pdf', is_active=False)
+        share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        with self.assertNumQueries(2):
+            page = dashboard_page(self.brand.id, Campaign.objects.all())
+        row = page.rows[0]
+        self.assertEqual((row['rep_count'], row['doctor_count'], row['collateral_count']), (1, 1, 1))
+        self.assertEqual(row['last_activity'], share.created_at)
+        with self.assertNumQueries(0):
+            dashboard_page(self.brand.id, Campaign.objects.all())
+
+    def test_search_pagination_and_invalidation(self):
+        for index in range(DASHBOARD_PAGE_SIZE):
+            Campaign.objects.create(company_name='Acme', brand_name=f'Brand {index}', contact_name='A', contact_phone='1', contact_email='a@a.com', created_by=self.publisher)
+        self.client.login(username='pub', password='x')
+        self.assertContains(self.client.get(reverse('dashboard')), 'Next')
+        resp = self.client.get(reverse('dashboard'), {'page': 2})
+        self.assertEqual(resp.context['page'].number, 2)
+        self.assertEqual(len(resp.context['campaigns']), 1)
+        resp = self.client.get(reverse('dashboard'), {'q': 'acme'})
+        self.assertEqual(resp.context['page'].count, DASHBOARD_PAGE_SIZE)
+        self.assertEqual(self.client.get(reverse('dashboard'), {'q': str(self.campaign.id)}).context['page'].count, 1)
+        Campaign.objects.filter(company_name='Acme').first().delete()
+        self.assertEqual(self.client.get(reverse('dashboard'), {'q': 'acme'}).context['page'].count, DASHBOARD_PAGE_SIZE - 1)
+
+
+class AccessTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        self.other = Campaign.objects.create(company_name='O', brand_name='O', contact_name='A', contact_phone='1', contact_email='a@a.com', created_by=self.publisher)
+
+    @override_settings(CACHES=SHARED_CACHES)
+    def test_access_is_cached_until_the_profile_changes(self):
+        caches['default'].clear()
+        access = access_for(self.brand)
+        self.assertEqual(access.role, 'brand_manager')
+        with self.assertNumQueries(0):
+            self.assertTrue(access_for(self.brand).can_access(self.campaign.id))
+            self.assertFalse(access_for(self.brand).can_access(self.other.id))
+        self.brand_profile.role = 'publisher'
+        self.brand_profile.save()
+        self.assertEqual(access_for(self.brand).role, 'publisher')
+
+    def test_per_process_cache_reloads_access_on_every_request(self):
+        self.assertTrue(access_for(self.brand).can_access(self.campaign.id))
+        with self.assertNumQueries(2):
+            self.assertTrue(access_for(self.brand).can_access(self.campaign.id))
+        # A removal recorded by another worker, which never reached this process's cache.
+        with mock.patch('education.signals.invalidate_access'):
+            self.campaign.managers.remove(self.brand_profile)
+        self.assertFalse(access_for(self.brand).can_access(self.campaign.id))
+        self.assertEqual([message.id for message in check_shared_caches(None)], ['education.W001', 'education.W001'])
+
+    def test_brand_views_enforce_campaign_scope(self):
+        self.client.login(username='bm', password='x')
+        self.assertEqual(self.client.get(reverse('brand_field_reps', args=[self.other.id])).status_code, 403)
+        self.assertEqual(self.client.get(reverse('campaign_detail', args=[self.other.id])).status_code, 403)
+        self.assertEqual(len(self.client.get(reverse('dashboard')).context['campaigns']), 1)
+        self.other.managers.add(self.brand_profile)
+        self.assertEqual(self.client.get(reverse('brand_field_reps', args=[self.other.id])).status_code, 200)
+        self.assertEqual(len(self.client.get(reverse('dashboard')).context['campaigns']), 2)
+
+    def test_publisher_assigns_brand_managers_on_create_and_later(self):
+        self.client.login(username='pub', password='x')
+        self.client.post(reverse('add_campaign'), {
+            'company_name': 'N', 'brand_name': 'New', 'expected_doctors': 5, 'contact_name': 'A', 'contact_phone': '1',
+            'contact_email': 'a@a.com', 'systems': ['inclinic'], 'brand_managers': [self.brand_profile.pk],
+        })
+        created = Campaign.objects.get(brand_name='New')
+        self.assertTrue(access_for(self.brand).can_access(created.id))
+        managers = reverse('campaign_managers', args=[self.other.id])
+        self.assertNotIn(self.brand_profile, self.client.get(managers).context['form'].initial['brand_managers'])
+        self.client.post(managers, {'brand_managers': [self.brand_profile.pk]})
+        self.assertTrue(access_for(self.brand).can_access(self.other.id))
+        self.client.post(managers, {})
+        self.assertFalse(access_for(self.brand).can_access(self.other.id))
+        self.client.login(username='bm', password='x')
+        self.assertEqual(self.client.get(managers).status_code, 403)
+
+
+class ShareAssetTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name, MEDIA_ACCEL_REDIRECT='')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.col.pdf_file = SimpleUploadedFile('deck.pdf', b'%PDF-0123456789', content_type='application/pdf')
+        self.col.save()
+        self.share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        self.url = reverse('share_asset', args=[self.share.short_code, 'pdf'])
+
+    def test_asset_requires_verified_session(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.post(reverse('short_link', args=[self.share.short_code]), {'phone': '8888888888'})
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b''.join(resp.streaming_content), b'%PDF-0123456789')
+        self.assertIn('immutable', resp['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('share_asset', args=[self.share.short_code, 'banner_1'])).status_code, 404)
+
+    def test_ranges_etags_and_accel_redirect(self):
+        self.client.post(reverse('short_link', args=[self.share.short_code]), {'phone': '8888888888'})
+        etag = self.client.get(self.url)['ETag']
+        resp = self.client.get(self.url, HTTP_RANGE='bytes=5-8')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp['Content-Range'], 'bytes 5-8/15')
+        self.assertEqual(b''.join(resp.streaming_content), b'0123')
+        self.assertEqual(b''.join(self.client.get(self.url, HTTP_RANGE='bytes=-3').streaming_content), b'789')
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=99-').status_code, 416)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"stale"').status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/'):
+            resp = self.client.get(self.url)
+        self.assertEqual(resp['X-Accel-Redirect'], f'/protected-media/{self.col.pdf_file.name}')
+        self.assertEqual(resp.content, b'')
+
+    async def test_asgi_requests_stream_the_file_in_chunks(self):
+        for headers, body in (({}, b'%PDF-0123456789'), ({'Range': 'bytes=5-8'}, b'0123')):
+            resp = serve_media(AsyncRequestFactory().get('/', headers=headers), self.col.pdf_file)
+            self.assertTrue(resp.is_async)
+            self.assertEqual(resp['Content-Length'], str(len(body)))
+            self.assertEqual(b''.join([chunk async for chunk in resp.streaming_content]), body)
+
+
+@override_settings(SYNC_JOB_EXECUTOR='inline')
+class AssetPipelineTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _png(self, width, height):
+        buffer = BytesIO()
+        Image.new('RGB', (width, height), (200, 40, 40)).save(buffer, 'PNG')
+        return SimpleUploadedFile('banner.png', buffer.getvalue(), content_type='image/png')
+
+    def _pdf(self, pages):
+        writer, buffer = PdfWriter(), BytesIO()
+        for _ in range(pages):
+            writer.add_blank_page(200, 200)
+        writer.write(buffer)
+        return buffer.getvalue()
+
+    def test_upload_generates_variants_and_pdf_metadata(self):
+        self.col.banner_1 = self._png(1200, 600)
+        self.col.pdf_file = SimpleUploadedFile('deck.pdf', self._pdf(2), content_type='application/pdf')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.col.save()
+        self.col.refresh_from_db()
+        banner = self.col.assets['banner_1']
+        self.assertEqual(sorted({(v['width'], v['height']) for v in banner['variants']}), [(480, 240), (960, 480)])
+        self.assertTrue(all(v['bytes'] > 0 for v in banner['variants']))
+        self.assertEqual(self.col.assets['pdf_file']['pages'], 2)
+        share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        self.client.post(reverse('short_link', args=[share.short_code]), {'phone': '8888888888'})
+        resp = self.client.get(reverse('doctor_landing', args=[share.short_code]))
+        self.assertContains(resp, '../asset/banner_1/480w.webp/ 480w')
+        self.assertContains(resp, '2 pages')
+        variant = reverse('share_asset_variant', args=[share.short_code, 'banner_1', '480w.webp'])
+        self.assertEqual(self.client.get(variant)['Content-Type'], 'image/webp')
+
+    def test_unreadable_uploads_record_an_error_or_unknown_pages(self):
+        self.col.banner_1 = self._png(300, 200)
+        self.col.pdf_file = SimpleUploadedFile('deck.pdf', b'%PDF-1.4 /Type /Pages /Count 40', content_type='application/pdf')
+        with mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100), self.assertLogs('education.assets', 'WARNING'), self.assertLogs('pypdf', 'WARNING'), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.col.save()
+        self.col.refresh_from_db()
+        self.assertIn('decompression bomb', self.col.assets['banner_1']['error'])
+        self.assertIsNone(self.col.assets['pdf_file']['pages'])
+        html = render_to_string('education/collateral_preview.html', _collateral_context(self.col, None, fragment_version(self.col.pk)))
+        self.assertIn('>31\xa0bytes</span>', html)
+        self.assertNotIn('page,', html)
+
+    def test_backfill_command_processes_existing_uploads(self):
+        Collateral.objects.filter(pk=self.col.pk).update(banner_2=Campaign._meta.get_field('desktop_banner').storage.save('collateral_banners/old.png', self._png(300, 200)))
+        out = StringIO()
+        call_command('backfill_assets', '--workers', '1', stdout=out)
+        self.assertIn('objects=1 failed_files=0', out.getvalue())
+        variants = Collateral.objects.get(pk=self.col.pk).assets['banner_2']['variants']
+        self.assertEqual({(v['format'], v['width']) for v in variants}, {('webp', 300), ('jpeg', 300)})
+
+
+class FragmentCacheTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        self.share, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+
+    def _render(self, share):
+        return render_to_string('education/collateral_preview.html', _collateral_context(share.collateral, share, fragment_version(share.collateral_id)))
+
+    def test_collateral_body_is_cached_until_the_collateral_changes(self):
+        first = self._render(self.share)
+        with mock.patch('education.views._to_vimeo_embed_url') as embed:
+            self.assertEqual(self._render(self.share), first)
+            embed.assert_not_called()
+        other, _ = create_share(self.campaign, self.rep, Doctor.objects.create(campaign=self.campaign, field_rep=self.rep, name='D2', whatsapp_number='7777777777'), self.col)
+        self.assertIn(f"const shareCode = '{other.short_code}'", self._render(other))
+        self.col.doctor_name = 'Dr. Updated'
+        self.col.save()
+        self.assertIn('Dr. Updated', self._render(ShareInstance.objects.select_related('collateral').get(pk=self.share.pk)))
+
+    def test_version_is_stored_on_the_collateral_row(self):
+        before = fragment_version(self.col.id)
+        caches['default'].clear()
+        self.assertEqual(fragment_version(self.col.id), before)
+        stale = Collateral.objects.get(pk=self.col.pk)
+        bump_fragment_version(self.col.id)
+        bumped = fragment_version(self.col.id)
+        self.assertGreater(bumped, before)
+        stale.save()
+        self.assertGreater(fragment_version(self.col.id), bumped)
+
+    def test_warm_render_skips_the_collateral_body_and_cold_render_rebuilds_it(self):
+        render_landing(self.share)
+        with mock.patch('education.views.banner_sources', return_value={}) as banners, mock.patch('education.views._to_vimeo_embed_url', return_value='') as embed:
+            render_landing(self.share)
+            self.assertEqual((banners.call_count, embed.call_count), (0, 0))
+            render_landing(self.share, cold=True)
+            self.assertEqual((banners.call_count, embed.call_count), (1, 1))
+
+
+class BulkShareTests(BaseSetup):
+    def setUp(self):
+        super().setUp()
+        self.col2 = Collateral.objects.create(campaign=self.campaign, system=self.system, classification='doctor_long', content_title='T2', item_type='pdf')
+        self.doc2 = Doctor.objects.create(campaign=self.campaign, field_rep=self.rep, name='Doc2', whatsapp_number='7777777777')
+
+    def test_batch_inserts_shares_and_events_in_constant_queries(self):
+        doctors = [self.doc, self.doc2] + [Doctor.objects.create(campaign=self.campaign, field_rep=self.rep, name=f'D{i}', whatsapp_number=f'600000000{i}') for i in range(8)]
+        with CaptureQueriesContext(connection) as ctx:
+            links = create_shares(self.campaign, self.rep, doctors, [self.col, self.col2])
+        self.assertEqual(len(links), 20)
+        self.assertLessEqual(len(ctx.captured_queries), 5)
+        codes = {share.short_code for share, _ in links}
+        self.assertEqual(len(codes), 20)
+        self.assertEqual(Event.objects.filter(event_type='share_initiated', share_instance_id__in=[share.id for share, _ in links]).count(), 20)
+        share, link = links[0]
+        self.assertIn(f'https%3A//example.com/s/{share.short_code}/', link)
+        self.assertTrue(link.startswith(f'https://api.whatsapp.com/send?phone={share.doctor.whatsapp_number}&'))
+
+    def test_colliding_codes_are_redrawn(self):
+        existing, _ = create_share(self.campaign, self.rep, self.doc, self.col)
+        with mock.patch('education.services.secrets.token_urlsafe', side_effect=[existing.short_code, 'freshcode001']):
+            (share, _), = create_shares(self.campaign, self.rep, [self.doc2], [self.col])
+        self.assertEqual(share.short_code, 'freshcode001')
+
+    def test_bulk_view_adds_new_doctors_and_lists_links(self):
+        session = self.client.session
+        session['field_rep_id'] = self.rep.id
+        session.save()
+        resp = self.client.post(reverse('field_rep_bulk_share'), {
+            'doctors': [self.doc.id], 'new_doctors': 'Dr New, 5555555555\nDoc, 8888888888', 'collaterals': [self.col.id, self.col2.id],
+        })
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(ShareInstance.objects.count(), 4)
+        self.assertEqual(self.rep.doctors.filter(whatsapp_number='5555555555').count(), 1)
+        self.assertEqual(self.rep.doctors.filter(whatsapp_number='8888888888').count(), 1)
+        self.assertContains(resp, 'api.whatsapp.com', count=4)
+        resp = self.client.post(reverse('field_rep_bulk_share'), {'new_doctors': 'no number', 'collaterals': [self.col.id]})
+        self.assertContains(resp, 'Line 1')
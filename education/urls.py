@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+doctor_views = async_views if settings.ASYNC_DOCTOR_VIEWS else views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -9,15 +12,22 @@ urlpatterns = [
     path('publisher/campaign/<uuid:campaign_id>/result/', views.campaign_result, name='campaign_result'),
     path('publisher/campaign/<uuid:campaign_id>/inclinic/', views.inclinic_config, name='inclinic_config'),
     path('publisher/campaign/<uuid:campaign_id>/detail/', views.campaign_detail, name='campaign_detail'),
+    path('publisher/campaign/<uuid:campaign_id>/managers/', views.campaign_managers, name='campaign_managers'),
     path('publisher/campaign/<uuid:campaign_id>/field-reps/upload/', views.upload_field_reps, name='upload_field_reps'),
     path('publisher/campaign/<uuid:campaign_id>/collaterals/', views.collateral_manage, name='collateral_manage'),
     path('publisher/campaign/<uuid:campaign_id>/collaterals/add/', views.collateral_add, name='collateral_add'),
     path('collateral/<int:collateral_id>/preview/', views.preview_collateral, name='preview_collateral'),
     path('field/login/', views.field_rep_login, name='field_rep_login'),
     path('field/share/', views.field_rep_share, name='field_rep_share'),
-    path('s/<str:code>/', views.short_link, name='short_link'),
-    path('s/<str:code>/landing/', views.doctor_landing, name='doctor_landing'),
-    path('s/<str:code>/track/', views.track_event, name='track_event'),
+    path('field/share/bulk/', views.field_rep_bulk_share, name='field_rep_bulk_share'),
+    path('s/<str:code>/', doctor_views.short_link, name='short_link'),
+    path('s/<str:code>/landing/', doctor_views.doctor_landing, name='doctor_landing'),
+    path('s/<str:code>/track/', doctor_views.track_event, name='track_event'),
+    path('s/<str:code>/asset/<str:kind>/', views.share_asset, name='share_asset'),
+    path('s/<str:code>/asset/<str:kind>/<str:variant>/', views.share_asset, name='share_asset_variant'),
     path('brand/<uuid:campaign_id>/field-reps/', views.brand_field_reps, name='brand_field_reps'),
     path('brand/<uuid:campaign_id>/reports/', views.brand_reports, name='brand_reports'),
+    path('reports/sync/status/', views.reporting_sync_status, name='reporting_sync_status'),
+    path('brand/<uuid:campaign_id>/reports/export/', views.brand_reports_export, name='brand_reports_export'),
+    path('metrics', views.metrics, name='metrics'),
 ]
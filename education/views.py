@@ -1,37 +1,59 @@
+import hmac
+from datetime import datetime, time, timedelta
+from functools import partial
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
-from django.core.management import call_command
+from django.core.exceptions import ValidationError
 from django.db.models import Q
-from django.http import HttpResponse, JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.functional import SimpleLazyObject
 from urllib.parse import urlparse
-from .forms import CampaignForm, CollateralForm, FieldRepCSVUploadForm, FieldRepLoginForm, InClinicConfigForm, ShareForm
-from .models import Campaign, CampaignSystem, Collateral, Doctor, Event, FieldRep, RecruitmentLink, ReportingEvent, ShareInstance, UserProfile
-from .services import create_share, doctor_status, ensure_link_clicked
-
-
-def _profile_for_user(user):
-    return UserProfile.objects.filter(user_id=user.id).only('role').first()
-
-
-def _role_for_user(user):
-    if user.is_superuser or user.is_staff:
-        return 'admin'
-    profile = _profile_for_user(user)
-    return profile.role if profile else None
-
-
-def _require_role(request, role):
+from .archive import report_funnel
+from .dashboards import dashboard_page
+from .exports import EXPORT_FORMATS, archived_rows, filtered_events, stream_events
+from .forms import BulkShareForm, CampaignForm, CampaignManagersForm, CollateralForm, FieldRepCSVUploadForm, FieldRepLoginForm, InClinicConfigForm, ShareForm
+from .fragments import fragment_version
+from .importers import import_field_reps
+from .ingest import ingest_event
+from .jobs import enqueue_sync
+from .media import SHARE_ASSETS, banner_sources, serve_media, variant_file
+from .metrics import count_event, registry
+from .models import Campaign, CampaignSystem, Collateral, Doctor, Event, FieldRep, RecruitmentLink, SyncState
+from .pagination import keyset_page
+from .replicas import replica_reads, replica_stats
+from .resolver import resolve_share, resolver
+from .rollups import report_summary
+from .services import create_share, create_shares, doctor_statuses, ensure_doctors, ensure_link_clicked, mark_engagement, record_video_progress
+from .streaming import streaming_content
+from .sync import sync_status
+
+UPLOAD_ERRORS_SHOWN = 20
+EVENT_PAGE_SIZE = 50
+TRACKED_EVENTS = ('video_progress', 'pdf_last_page', 'pdf_downloaded')
+DASHBOARD_TEMPLATES = {'publisher': 'education/publisher_dashboard.html', 'brand_manager': 'education/brand_dashboard.html', 'admin': 'education/admin_dashboard.html'}
+EVENT_FILTERS = {'type': 'event_type', 'rep': 'field_rep_id', 'collateral': 'collateral_id', 'doctor': 'doctor_id'}
+
+
+def _require_role(request, role, campaign_id=None):
     if request.user.is_superuser:
         return None
-    profile = _profile_for_user(request.user)
-    if not profile or profile.role != role:
+    if request.access.role != role or (campaign_id is not None and not request.access.can_access(campaign_id)):
         return HttpResponse(status=403)
     return None
 
 
+def _require_campaign(request, campaign_id):
+    if request.user.is_superuser or request.access.can_access(campaign_id):
+        return None
+    return HttpResponse(status=403)
+
+
 def home(request):
     return redirect('login')
 
@@ -44,19 +66,16 @@ def login_view(request):
     return render(request, 'education/login.html', {'form': form})
 
 
+@replica_reads
 @login_required
 def dashboard(request):
-    role = _role_for_user(request.user)
-    if role == 'publisher':
-        campaigns = Campaign.objects.filter(created_by=request.user)
-        return render(request, 'education/publisher_dashboard.html', {'campaigns': campaigns})
-    if role == 'brand_manager':
-        campaigns = Campaign.objects.all()
-        return render(request, 'education/brand_dashboard.html', {'campaigns': campaigns})
-    if role == 'admin':
-        campaigns = Campaign.objects.all()
-        return render(request, 'education/admin_dashboard.html', {'campaigns': campaigns})
-    return HttpResponse('User role is not configured. Contact administrator.', status=403)
+    role = request.access.role
+    if role not in DASHBOARD_TEMPLATES:
+        return HttpResponse('User role is not configured. Contact administrator.', status=403)
+    campaigns = request.access.campaigns()
+    search = request.GET.get('q', '').strip()
+    page = dashboard_page(request.user.id, campaigns, search, request.GET.get('page', 1))
+    return render(request, DASHBOARD_TEMPLATES[role], {'page': page, 'campaigns': page.rows, 'search': search})
 
 
 @login_required
@@ -70,6 +89,7 @@ def add_campaign(request):
         campaign = form.save(commit=False)
         campaign.created_by = request.user
         campaign.save()
+        campaign.managers.set(form.cleaned_data['brand_managers'])
         for system in systems:
             CampaignSystem.objects.create(campaign=campaign, system=system)
         RecruitmentLink.objects.create(campaign=campaign)
@@ -77,14 +97,21 @@ def add_campaign(request):
     return render(request, 'education/add_campaign.html', {'form': form})
 
 
+@replica_reads
 @login_required
 def campaign_result(request, campaign_id):
+    denied = _require_campaign(request, campaign_id)
+    if denied:
+        return denied
     campaign = get_object_or_404(Campaign, id=campaign_id)
     return render(request, 'education/campaign_result.html', {'campaign': campaign})
 
 
 @login_required
 def inclinic_config(request, campaign_id):
+    denied = _require_campaign(request, campaign_id)
+    if denied:
+        return denied
     campaign = get_object_or_404(Campaign, id=campaign_id)
     config = get_object_or_404(CampaignSystem, campaign=campaign, system='inclinic')
     form = InClinicConfigForm(request.POST or None, request.FILES or None, instance=config)
@@ -94,8 +121,26 @@ def inclinic_config(request, campaign_id):
     return render(request, 'education/inclinic_config.html', {'form': form, 'campaign': campaign})
 
 
+@login_required
+def campaign_managers(request, campaign_id):
+    denied = _require_role(request, 'publisher', campaign_id)
+    if denied:
+        return denied
+    campaign = get_object_or_404(Campaign, id=campaign_id)
+    form = CampaignManagersForm(request.POST if request.method == 'POST' else None, initial={'brand_managers': campaign.managers.all()})
+    if request.method == 'POST' and form.is_valid():
+        campaign.managers.set(form.cleaned_data['brand_managers'])
+        messages.success(request, 'Brand managers updated')
+        return redirect('campaign_detail', campaign_id=campaign.id)
+    return render(request, 'education/campaign_managers.html', {'form': form, 'campaign': campaign})
+
+
+@replica_reads
 @login_required
 def campaign_detail(request, campaign_id):
+    denied = _require_campaign(request, campaign_id)
+    if denied:
+        return denied
     campaign = get_object_or_404(Campaign, id=campaign_id)
     config = CampaignSystem.objects.filter(campaign=campaign, system='inclinic').first()
     return render(request, 'education/campaign_detail.html', {'campaign': campaign, 'config': config})
@@ -103,23 +148,32 @@ def campaign_detail(request, campaign_id):
 
 @login_required
 def upload_field_reps(request, campaign_id):
+    denied = _require_campaign(request, campaign_id)
+    if denied:
+        return denied
     campaign = get_object_or_404(Campaign, id=campaign_id)
     form = FieldRepCSVUploadForm(request.POST or None, request.FILES or None)
     if request.method == 'POST' and form.is_valid():
-        rows = form.parse()
-        for row in rows:
-            FieldRep.objects.get_or_create(
-                campaign=campaign,
-                brand_rep_id=row['brand-supplied-field-rep-id'],
-                defaults={'name': row['field-rep-name'], 'email': row['email-id'], 'phone': row['phone-number']},
-            )
-        messages.success(request, 'Field reps uploaded.')
-        return redirect('campaign_detail', campaign_id=campaign.id)
+        try:
+            result = import_field_reps(campaign, form.parse())
+        except ValidationError as exc:
+            form.add_error('csv_file', exc)
+        else:
+            messages.success(request, f'Field reps uploaded: {result.inserted} added, {result.updated} updated, {result.skipped} unchanged, {len(result.errors)} rejected.')
+            for line, error in result.errors[:UPLOAD_ERRORS_SHOWN]:
+                messages.warning(request, f'Line {line}: {error}')
+            if len(result.errors) > UPLOAD_ERRORS_SHOWN:
+                messages.warning(request, f'{len(result.errors) - UPLOAD_ERRORS_SHOWN} more rows were rejected.')
+            return redirect('campaign_detail', campaign_id=campaign.id)
     return render(request, 'education/upload_field_reps.html', {'form': form, 'campaign': campaign})
 
 
+@replica_reads
 @login_required
 def collateral_manage(request, campaign_id):
+    denied = _require_campaign(request, campaign_id)
+    if denied:
+        return denied
     campaign = get_object_or_404(Campaign, id=campaign_id)
     collaterals = Collateral.objects.filter(campaign=campaign)
     return render(request, 'education/collateral_manage.html', {'campaign': campaign, 'collaterals': collaterals})
@@ -127,6 +181,9 @@ def collateral_manage(request, campaign_id):
 
 @login_required
 def collateral_add(request, campaign_id):
+    denied = _require_campaign(request, campaign_id)
+    if denied:
+        return denied
     campaign = get_object_or_404(Campaign, id=campaign_id)
     system = get_object_or_404(CampaignSystem, campaign=campaign, system='inclinic')
     form = CollateralForm(request.POST or None, request.FILES or None)
@@ -139,12 +196,21 @@ def collateral_add(request, campaign_id):
     return render(request, 'education/collateral_add.html', {'form': form, 'campaign': campaign})
 
 
+@replica_reads
 def preview_collateral(request, collateral_id):
     collateral = get_object_or_404(Collateral, id=collateral_id)
-    return render(request, 'education/collateral_preview.html', {
-        'collateral': collateral,
-        'vimeo_embed_url': _to_vimeo_embed_url(collateral.vimeo_url),
-    })
+    return render(request, 'education/collateral_preview.html', _collateral_context(collateral, version=fragment_version(collateral.id)))
+
+
+def _collateral_context(collateral, share=None, version=None):
+    # Lazy values: they are only evaluated when the cached collateral fragment has to be rendered again.
+    return {
+        'collateral': collateral, 'share': share,
+        'fragment_version': version, 'fragment_mode': 'share' if share else 'preview', 'fragment_timeout': settings.FRAGMENT_CACHE_TIMEOUT,
+        'fragment_cache': settings.FRAGMENT_CACHE_ALIAS,
+        'banners': SimpleLazyObject(partial(banner_sources, collateral, share is not None)),
+        'vimeo_embed_url': partial(_to_vimeo_embed_url, collateral.vimeo_url),
+    }
 
 
 def _to_vimeo_embed_url(url):
@@ -193,24 +259,47 @@ def field_rep_share(request):
         collateral = get_object_or_404(Collateral, id=form.cleaned_data['collateral'])
         _, wa_url = create_share(rep.campaign, rep, doctor, collateral)
         return redirect(wa_url)
-    doctor_rows = [(doctor, doctor_status(rep, doctor)) for doctor in doctors]
+    doctor_rows = doctor_statuses(rep, doctors)
     return render(request, 'education/field_rep_share.html', {'form': form, 'doctor_rows': doctor_rows, 'collaterals': collaterals})
 
 
+def field_rep_bulk_share(request):
+    rep = get_object_or_404(FieldRep, id=request.session.get('field_rep_id'))
+    form = BulkShareForm(request.POST or None, rep=rep)
+    links = []
+    if request.method == 'POST' and form.is_valid():
+        doctors = list(form.cleaned_data['doctors'])
+        if form.cleaned_data['new_doctors']:
+            known = {doctor.whatsapp_number for doctor in doctors}
+            doctors += [doctor for doctor in ensure_doctors(rep, form.cleaned_data['new_doctors']) if doctor.whatsapp_number not in known]
+        links = create_shares(rep.campaign, rep, doctors, list(form.cleaned_data['collaterals']))
+        form = BulkShareForm(rep=rep)
+    return render(request, 'education/field_rep_bulk_share.html', {'form': form, 'links': links})
+
+
+def _share_or_404(code):
+    share = resolve_share(code)
+    if share is None:
+        raise Http404('Unknown share code')
+    return share
+
+
 def short_link(request, code):
-    share = get_object_or_404(ShareInstance, short_code=code)
+    share = _share_or_404(code)
     ensure_link_clicked(share)
     if request.method == 'POST':
         phone = request.POST.get('phone')
         if phone == share.doctor.whatsapp_number:
+            mark_engagement(share, 'landing_access')
             Event.objects.create(
                 event_type='landing_access',
-                campaign=share.campaign,
-                collateral=share.collateral,
-                field_rep=share.field_rep,
-                doctor=share.doctor,
-                share_instance=share,
+                campaign_id=share.campaign_id,
+                collateral_id=share.collateral_id,
+                field_rep_id=share.field_rep_id,
+                doctor_id=share.doctor_id,
+                share_instance_id=share.id,
             )
+            count_event('landing_access')
             request.session[f'verified_{share.id}'] = True
             return redirect('doctor_landing', code=code)
         messages.error(request, 'Verification failed')
@@ -218,35 +307,65 @@ def short_link(request, code):
 
 
 def doctor_landing(request, code):
-    share = get_object_or_404(ShareInstance, short_code=code)
+    share = _share_or_404(code)
     if not request.session.get(f'verified_{share.id}'):
         return redirect('short_link', code=code)
-    return render(request, 'education/collateral_preview.html', {
-        'collateral': share.collateral,
-        'share': share,
-        'vimeo_embed_url': _to_vimeo_embed_url(share.collateral.vimeo_url),
-    })
+    return render(request, 'education/collateral_preview.html', _collateral_context(share.collateral, share, fragment_version(share.collateral_id)))
 
 
-def track_event(request, code):
-    share = get_object_or_404(ShareInstance, short_code=code)
+def share_asset(request, code, kind, variant=None):
+    share = _share_or_404(code)
+    if kind not in SHARE_ASSETS or not request.session.get(f'verified_{share.id}'):
+        raise Http404('Unknown asset')
+    field_file = getattr(share.collateral, SHARE_ASSETS[kind])
+    if field_file and variant:
+        field_file = variant_file(share.collateral, SHARE_ASSETS[kind], variant)
+    if not field_file:
+        raise Http404('Unknown asset')
+    return serve_media(request, field_file)
+
+
+def _beacon_payload(request):
     kind = request.GET.get('type')
-    percentage = request.GET.get('percentage')
-    Event.objects.create(
+    if kind not in TRACKED_EVENTS:
+        return None
+    if kind != 'video_progress':
+        return kind, None
+    percentage = request.GET.get('percentage', '')
+    if not percentage.isdigit() or int(percentage) > 100:
+        return None
+    return kind, int(percentage)
+
+
+def track_event(request, code):
+    share = _share_or_404(code)
+    payload = _beacon_payload(request)
+    if payload is None:
+        return JsonResponse({'status': 'invalid'}, status=400)
+    kind, percentage = payload
+    if kind == 'video_progress':
+        percentage = record_video_progress(share, percentage)
+        if percentage is None:
+            registry.inc('inclinic_video_pings_coalesced_total')
+            return JsonResponse({'status': 'coalesced'})
+    else:
+        mark_engagement(share, kind)
+    ingest_event(
         event_type=kind,
-        campaign=share.campaign,
-        collateral=share.collateral,
-        field_rep=share.field_rep,
-        doctor=share.doctor,
-        share_instance=share,
-        video_percentage=int(percentage) if percentage else None,
+        campaign_id=share.campaign_id,
+        collateral_id=share.collateral_id,
+        field_rep_id=share.field_rep_id,
+        doctor_id=share.doctor_id,
+        share_instance_id=share.id,
+        video_percentage=percentage,
     )
-    return JsonResponse({'status': 'ok'})
+    return JsonResponse({'status': 'queued' if settings.EVENT_INGEST_MODE == 'buffered' else 'ok'})
 
 
+@replica_reads
 @login_required
 def brand_field_reps(request, campaign_id):
-    denied = _require_role(request, 'brand_manager')
+    denied = _require_role(request, 'brand_manager', campaign_id)
     if denied:
         return denied
     campaign = get_object_or_404(Campaign, id=campaign_id)
@@ -255,23 +374,111 @@ def brand_field_reps(request, campaign_id):
     return render(request, 'education/brand_field_reps.html', {'campaign': campaign, 'reps': reps})
 
 
+def _report_range(request):
+    start, end = (parse_date(request.GET.get(name) or '') for name in ('from', 'to'))
+    return (
+        timezone.make_aware(datetime.combine(start, time.min)) if start else None,
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)) if end else None,
+    )
+
+
+def _event_filters(request):
+    filters = {}
+    for param, field in EVENT_FILTERS.items():
+        value = request.GET.get(param, '').strip()
+        if not value:
+            continue
+        if (value not in dict(Event.TYPE_CHOICES)) if field == 'event_type' else not value.isdigit():
+            raise ValueError(f'invalid {param}')
+        filters[field] = value
+    return filters
+
+
+@replica_reads
 @login_required
 def brand_reports(request, campaign_id):
-    denied = _require_role(request, 'brand_manager')
+    denied = _require_role(request, 'brand_manager', campaign_id)
     if denied:
         return denied
     if request.method == 'POST' and request.POST.get('action') == 'sync_now':
-        call_command('sync_reporting')
-        messages.success(request, 'Reporting sync executed successfully.')
+        if enqueue_sync():
+            messages.success(request, 'Reporting sync started. Figures refresh when it finishes.')
+        else:
+            messages.info(request, 'A reporting sync is already running.')
         return redirect('brand_reports', campaign_id=campaign_id)
-    events = ReportingEvent.objects.using('reporting').filter(campaign_id=campaign_id)
-    summary = {
-        'unique_doctors': events.values('doctor_id').distinct().count(),
-        'clicked': events.filter(event_type='link_clicked').values('doctor_id').distinct().count(),
-        'downloads': events.filter(event_type='pdf_downloaded').values('doctor_id').distinct().count(),
-        'last_page': events.filter(event_type='pdf_last_page').values('doctor_id').distinct().count(),
-        'video_50': events.filter(event_type='video_progress', video_percentage__gte=50).values('doctor_id').distinct().count(),
-        'video_100': events.filter(event_type='video_progress', video_percentage=100).values('doctor_id').distinct().count(),
-        'total': events.count(),
-    }
-    return render(request, 'education/brand_reports.html', {'summary': summary, 'events': events[:100]})
+    try:
+        start, end = _report_range(request)
+    except ValueError:
+        start = end = None
+    try:
+        filters = _event_filters(request)
+    except ValueError:
+        filters = {}
+    summary = report_funnel(campaign_id, start, end) if start or end else report_summary(campaign_id)
+    page = keyset_page(filtered_events(campaign_id, start, end, **filters), request.GET.get('cursor'), EVENT_PAGE_SIZE)
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    return render(request, 'education/brand_reports.html', {
+        'summary': summary, 'page': page, 'sync': sync_status(), 'query': query.urlencode(), 'filters': request.GET,
+        'campaign_id': campaign_id, 'event_types': Event.TYPE_CHOICES,
+        'reps': FieldRep.objects.filter(campaign_id=campaign_id).only('id', 'name').order_by('name'),
+        'collaterals': Collateral.objects.filter(campaign_id=campaign_id).only('id', 'content_title').order_by('content_title'),
+    })
+
+
+@login_required
+def brand_reports_export(request, campaign_id):
+    denied = _require_role(request, 'brand_manager', campaign_id)
+    if denied:
+        return denied
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponse('Unsupported export format', status=400)
+    try:
+        start, end = _report_range(request)
+    except ValueError:
+        return HttpResponse('Invalid date range', status=400)
+    try:
+        filters = _event_filters(request)
+    except ValueError as exc:
+        return HttpResponse(f'Invalid filter: {exc}', status=400)
+    compress = request.GET.get('gzip') == '1'
+    archived = archived_rows(campaign_id, start, end, **filters) if request.GET.get('archived') == '1' else ()
+    body = stream_events(filtered_events(campaign_id, start, end, **filters).order_by('created_at', 'id'), fmt, compress, archived)
+    filename = f'events-{campaign_id}.{fmt}' + ('.gz' if compress else '')
+    response = StreamingHttpResponse(streaming_content(request, body), content_type='application/gzip' if compress else EXPORT_FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+def reporting_sync_status(request):
+    denied = _require_role(request, 'brand_manager')
+    if denied:
+        return denied
+    return JsonResponse(sync_status())
+
+
+def _metrics_allowed(request):
+    token = settings.METRICS_TOKEN
+    header = request.headers.get('Authorization', '')
+    if token and hmac.compare_digest(header, f'Bearer {token}'):
+        return True
+    return request.user.is_authenticated and (request.user.is_staff or request.user.is_superuser)
+
+
+def metrics(request):
+    if not _metrics_allowed(request):
+        return HttpResponse(status=403)
+    gauges = [('inclinic_share_resolver_' + name, {}, value) for name, value in resolver.stats().items()]
+    gauges += [('inclinic_replica_lag_seconds', {'db': alias}, lag) for alias, lag in replica_stats().items()]
+    state = SyncState.objects.using('reporting').filter(pk=1).first()
+    if state:
+        gauges += [
+            ('inclinic_sync_backlog_rows', {}, state.last_remaining),
+            ('inclinic_sync_lag_seconds', {}, state.last_lag_seconds),
+            ('inclinic_sync_last_rows_per_second', {}, state.last_rows_per_second),
+            ('inclinic_sync_last_transferred', {}, state.last_transferred),
+            ('inclinic_sync_last_run_timestamp_seconds', {}, state.last_run_at.timestamp() if state.last_run_at else 0),
+        ]
+    return HttpResponse(registry.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')